@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        import api.checks  # noqa: F401
+        import api.signals  # noqa: F401
+        from api.utils import register_fonts
+
+        register_fonts()
@@ -0,0 +1,158 @@
+from hashlib import md5
+from random import randrange
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+
+from recipes.models import Ingredient, Tag
+
+INGREDIENTS_VERSION_KEY = 'ingredients_version'
+RECIPES_VERSION_KEY = 'recipes_version'
+RECIPE_INGREDIENTS_VERSION_KEY = 'recipe_ingredients_version'
+RECIPE_SCORES_VERSION_KEY = 'recipe_scores_version'
+TAGS_VERSION_KEY = 'tags_version'
+USERS_VERSION_KEY = 'users_version'
+# Бэкенды, в которых incr выполняется одной операцией на сервере
+# или под блокировкой, если кэш принадлежит одному процессу.
+ATOMIC_INCR_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.memcached.MemcachedCache',
+    'django.core.cache.backends.memcached.PyLibMCCache',
+    'django.core.cache.backends.memcached.PyMemcacheCache',
+    'django_redis.cache.RedisCache',
+)
+
+
+def cart_version_key(user_id):
+    return f'shopping_cart_version:{user_id}'
+
+
+def user_flags_version_key(user_id):
+    """Версия избранного, корзины и подписок пользователя."""
+    return f'user_flags_version:{user_id}'
+
+
+def recipe_version_key(recipe_id):
+    return f'recipe_version:{recipe_id}'
+
+
+def author_version_key(author_id):
+    """Версия профиля автора в карточках его рецептов."""
+    return f'author_version:{author_id}'
+
+
+def get_version(key):
+    """Текущая версия данных, хранится в кэше без срока действия."""
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(*keys):
+    """Смена версии делает недействительными все зависящие от неё ключи."""
+    cache.set_many({key: uuid4().hex for key in keys}, None)
+
+
+def recipe_detail_key(recipe_id, author_id, updated_at, base_url):
+    """Ключ общей для всех пользователей части карточки рецепта.
+    updated_at учитывает изменения рецепта через queryset.update()."""
+    state = ':'.join(
+        (
+            str(recipe_id),
+            str(updated_at),
+            base_url,
+            *(
+                get_version(key)
+                for key in (
+                    recipe_version_key(recipe_id),
+                    author_version_key(author_id),
+                    TAGS_VERSION_KEY,
+                    INGREDIENTS_VERSION_KEY,
+                )
+            ),
+        )
+    )
+    return f'recipe_detail:{recipe_id}:{md5(state.encode()).hexdigest()}'
+
+
+def has_atomic_incr():
+    """cache.incr атомарен для всех процессов, а не читает значение
+    и записывает новое отдельными операциями."""
+    return settings.CACHES['default']['BACKEND'] in ATOMIC_INCR_BACKENDS
+
+
+def get_counter(key):
+    """Версия-счётчик: в отличие от get_version позволяет понять,
+    было ли между двумя чтениями ровно одно изменение. Начальное
+    значение случайное, чтобы счётчик после очистки кэша
+    не совпал с прежним."""
+    cache.add(key, randrange(2 ** 32), None)
+    return cache.get(key)
+
+
+def increment_counter(key):
+    """Новое значение счётчика. Если incr бэкенда не атомарен,
+    параллельные приращения могут потеряться, поэтому записывается
+    случайная версия и возвращается None."""
+    if not has_atomic_incr():
+        bump_version(key)
+        return None
+    try:
+        get_counter(key)
+        return cache.incr(key)
+    except ValueError:
+        # Ключ вытеснен из кэша между add и incr.
+        return get_counter(key)
+
+
+def get_tag_choices():
+    """Слаги тегов для фильтра, без запроса к БД при каждом обращении."""
+    key = f'tag_choices:{get_version(TAGS_VERSION_KEY)}'
+    choices = cache.get(key)
+    if choices is None:
+        choices = [
+            (slug, slug) for slug in Tag.objects.values_list('slug', flat=True)
+        ]
+        cache.set(key, choices)
+    return choices
+
+
+def get_shopping_list(user):
+    """Рецепты и суммарное количество продуктов в корзине пользователя."""
+    key = (
+        f'shopping_list:{user.id}:'
+        f'{get_version(cart_version_key(user.id))}'
+    )
+    shopping_list = cache.get(key)
+    if shopping_list is None:
+        shopping_list = {
+            'recipes': list(
+                user.carts.values_list('recipe__name', flat=True)
+            ),
+            'ingredients': list(
+                Ingredient.objects.filter(recipes__carts__user=user)
+                .values('name', 'measurement_unit')
+                .annotate(amount=Sum('amount_ingredients__amount'))
+            ),
+        }
+        cache.set(key, shopping_list, settings.SHOPPING_LIST_CACHE_TIMEOUT)
+    return shopping_list
+
+
+def get_shopping_list_document(user, renderer):
+    """Список покупок в формате renderer, повторно не формируется,
+    пока не изменится корзина."""
+    key = (
+        f'shopping_list_document:{user.id}:{renderer.format}:'
+        f'{get_version(cart_version_key(user.id))}:{timezone.now().date()}'
+    )
+    document = cache.get(key)
+    if document is None:
+        document = renderer.render(get_shopping_list(user))
+        cache.set(key, document, settings.SHOPPING_LIST_CACHE_TIMEOUT)
+    return document
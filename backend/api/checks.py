@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """Версии данных хранятся в кэше: если он не общий для процессов,
+    изменения из команд manage.py не видны воркерам сервера.
+    Тесты работают в одном процессе и используют кэш в памяти."""
+    if (
+        not settings.TESTING
+        and settings.CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHES
+    ):
+        return [
+            Error(
+                'Кэш по умолчанию не общий для процессов.',
+                hint=(
+                    'Укажите в CACHE_BACKEND и CACHE_LOCATION общий кэш, '
+                    'например memcached или кэш в файлах.'
+                ),
+                id='api.E001',
+            )
+        ]
+    return []
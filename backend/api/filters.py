@@ -1,9 +1,13 @@
 import django_filters
 from django.contrib.auth import get_user_model
-from django_filters import filters
+from django.db.models import Exists, F, OuterRef
 from django_filters.widgets import BooleanWidget
+from rest_framework import serializers
 
+from api.cache import get_tag_choices
+from api.paginations import is_cursor_pagination
 from recipes.models import Ingredient, Recipe
+from recipes.search import search
 
 User = get_user_model()
 
@@ -27,8 +31,21 @@ class RecipesFilter(django_filters.FilterSet):
         label='Корзина',
         widget=BooleanWidget(),
     )
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = django_filters.MultipleChoiceFilter(
+        choices=get_tag_choices,
+        method='filter_tags',
+        label='Теги',
+    )
     author = django_filters.ModelChoiceFilter(queryset=User.objects.all())
+    search = django_filters.CharFilter(method='filter_search', label='Поиск')
+    ordering = django_filters.ChoiceFilter(
+        choices=(
+            ('popular', 'Популярные'),
+            ('trending', 'Набирающие популярность'),
+        ),
+        method='filter_ordering',
+        label='Сортировка',
+    )
 
     class Meta:
         model = Recipe
@@ -37,6 +54,39 @@ class RecipesFilter(django_filters.FilterSet):
             'author',
             'is_favorited',
             'is_in_shopping_cart',
+            'search',
+            'ordering',
+        )
+
+    def filter_tags(self, recipes, name, value):
+        return recipes.filter(
+            Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe=OuterRef('pk'), tag__slug__in=value
+                )
+            )
+        )
+
+    def filter_search(self, recipes, name, value):
+        """Поиск по названию, описанию и продуктам,
+        сначала самые подходящие рецепты. Курсорная пагинация
+        сортирует по дате и заменила бы порядок релевантности."""
+        if not value.strip():
+            return recipes
+        if is_cursor_pagination(self.request):
+            raise serializers.ValidationError(
+                {'search': 'Поиск не поддерживает pagination=cursor.'}
+            )
+        return search(recipes, value).order_by(
+            '-search_rank', '-pub_date', '-id'
+        )
+
+    def filter_ordering(self, recipes, name, value):
+        """Запись популярности есть у каждого рецепта, поэтому
+        соединение внутреннее, а порядок совпадает с индексом."""
+        field = 'popularity' if value == 'popular' else 'trending'
+        return recipes.filter(score__isnull=False).order_by(
+            F(f'score__{field}').desc(), F('score__recipe').desc()
         )
 
     def filter_recipe_is_favorited(self, recipes, name, value):
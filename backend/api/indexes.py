@@ -0,0 +1,161 @@
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from threading import Lock
+
+from api.cache import (INGREDIENTS_VERSION_KEY, RECIPE_INGREDIENTS_VERSION_KEY,
+                       get_counter, get_version, increment_counter)
+from recipes.models import AmountReceptIngredients, Ingredient
+
+
+class IngredientIndex:
+    """Продукты в памяти процесса для поиска по названию без запросов к БД.
+    Перестраивается, когда меняется версия каталога продуктов."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._entries = ((), ())
+
+    def _get_entries(self):
+        version = get_version(INGREDIENTS_VERSION_KEY)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    ingredients = sorted(
+                        Ingredient.objects.values(
+                            'id', 'name', 'measurement_unit'
+                        ),
+                        key=lambda ingredient: ingredient['name'].lower(),
+                    )
+                    self._entries = (
+                        tuple(
+                            ingredient['name'].lower()
+                            for ingredient in ingredients
+                        ),
+                        tuple(ingredients),
+                    )
+                    self._version = version
+        return self._entries
+
+    def all(self):
+        return list(self._get_entries()[1])
+
+    def search(self, query, limit):
+        """Сначала продукты, название которых начинается с query,
+        затем содержащие query, не больше limit."""
+        names, ingredients = self._get_entries()
+        query = query.lower()
+        found = []
+        position = bisect_left(names, query)
+        while (
+            len(found) < limit
+            and position < len(names)
+            and names[position].startswith(query)
+        ):
+            found.append(ingredients[position])
+            position += 1
+        for name, ingredient in zip(names, ingredients):
+            if len(found) >= limit:
+                break
+            if query in name and not name.startswith(query):
+                found.append(ingredient)
+        return found
+
+
+ingredient_index = IngredientIndex()
+
+
+class RecipeIngredientIndex:
+    """Обратный индекс продукт -> рецепты в памяти процесса.
+    Изменения рецептов этого процесса применяются на месте, изменения
+    других процессов замечаются по счётчику версий и ведут к перестройке.
+    Если incr кэша не атомарен, каждое изменение ведёт к перестройке.
+    Множества не изменяются, а заменяются, поэтому чтение без блокировки
+    безопасно."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._index = ({}, {})
+
+    def _get_index(self):
+        version = get_counter(RECIPE_INGREDIENTS_VERSION_KEY)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    recipes = defaultdict(set)
+                    ingredients = defaultdict(set)
+                    for recipe_id, ingredient_id in (
+                        AmountReceptIngredients.objects.values_list(
+                            'recipe_id', 'ingredient_id'
+                        ).iterator()
+                    ):
+                        recipes[ingredient_id].add(recipe_id)
+                        ingredients[recipe_id].add(ingredient_id)
+                    self._index = (
+                        {
+                            ingredient_id: frozenset(recipe_ids)
+                            for ingredient_id, recipe_ids in recipes.items()
+                        },
+                        {
+                            recipe_id: frozenset(ingredient_ids)
+                            for recipe_id, ingredient_ids in (
+                                ingredients.items()
+                            )
+                        },
+                    )
+                    self._version = version
+        return self._index
+
+    def update(self, recipe_id, ingredient_ids=()):
+        """Новый набор продуктов рецепта, пустой при удалении.
+        Вызывается после фиксации транзакции."""
+        version = increment_counter(RECIPE_INGREDIENTS_VERSION_KEY)
+        with self._lock:
+            if (
+                version is None
+                or self._version is None
+                or version != self._version + 1
+            ):
+                # Были и другие изменения или их нельзя отличить,
+                # индекс будет перестроен.
+                return
+            recipes, ingredients = self._index
+            new = frozenset(ingredient_ids)
+            old = ingredients.get(recipe_id, frozenset())
+            for ingredient_id in old - new:
+                recipes[ingredient_id] = recipes[ingredient_id] - {recipe_id}
+            for ingredient_id in new - old:
+                recipes[ingredient_id] = recipes.get(
+                    ingredient_id, frozenset()
+                ) | {recipe_id}
+            if new:
+                ingredients[recipe_id] = new
+            else:
+                ingredients.pop(recipe_id, None)
+            self._version = version
+
+    def find(self, ingredient_ids):
+        """(id рецепта, есть продуктов, всего продуктов) для рецептов
+        хотя бы с одним из продуктов: сначала с наибольшей долей
+        имеющихся, затем с наименьшим числом недостающих."""
+        recipes, ingredients = self._get_index()
+        matched = Counter()
+        for ingredient_id in set(ingredient_ids):
+            matched.update(recipes.get(ingredient_id, ()))
+        found = []
+        for recipe_id, count in matched.items():
+            total = len(ingredients.get(recipe_id, ()))
+            if total:
+                found.append((recipe_id, min(count, total), total))
+        found.sort(
+            key=lambda recipe: (
+                -recipe[1] / recipe[2],
+                recipe[2] - recipe[1],
+                recipe[0],
+            )
+        )
+        return found
+
+
+recipe_ingredient_index = RecipeIngredientIndex()
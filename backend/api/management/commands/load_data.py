@@ -0,0 +1,157 @@
+import csv
+import json
+import re
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.cache import INGREDIENTS_VERSION_KEY, TAGS_VERSION_KEY, bump_version
+from recipes.models import Ingredient, Tag
+
+MODELS = {
+    'ingredient': (Ingredient, ('name', 'measurement_unit')),
+    'tag': (Tag, ('name', 'slug')),
+}
+# bulk_create не вызывает сигналы, версии меняются командой.
+VERSION_KEYS = {
+    'ingredient': INGREDIENTS_VERSION_KEY,
+    'tag': TAGS_VERSION_KEY,
+}
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def iter_json_array(file, chunk_size=64 * 1024):
+    """Элементы JSON-массива по одному, без чтения всего файла в память."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(chunk_size)
+    position = WHITESPACE.match(buffer).end()
+    if buffer[position:position + 1] != '[':
+        raise CommandError('Ожидается JSON-массив.')
+    position += 1
+    while True:
+        position = WHITESPACE.match(buffer, position).end()
+        if buffer[position:position + 1] == ',':
+            position = WHITESPACE.match(buffer, position + 1).end()
+        if buffer[position:position + 1] == ']':
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                raise CommandError('Некорректный JSON.')
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+
+
+class Command(BaseCommand):
+    help = (
+        'Загрузка продуктов и тегов из CSV и JSON файлов. '
+        'Уже существующие записи пропускаются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help='Файлы CSV или JSON.')
+        parser.add_argument(
+            '--model',
+            choices=MODELS,
+            default='ingredient',
+            help='Модель для строк CSV.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество записей в одном запросе.',
+        )
+
+    def handle(self, *args, **options):
+        changed = set()
+        for path in options['files']:
+            start = time.monotonic()
+            counts = self.count_rows()
+            with open(path, encoding='utf-8', newline='') as file:
+                if path.endswith('.json'):
+                    rows = self.read_json(file)
+                else:
+                    rows = self.read_csv(file, options['model'])
+                processed = self.load(rows, options['batch_size'])
+            inserted = {
+                model: count - counts[model]
+                for model, count in self.count_rows().items()
+            }
+            changed.update(model for model in inserted if inserted[model])
+            elapsed = max(time.monotonic() - start, 1e-6)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'{path}: обработано {processed} строк, '
+                    f'добавлено {sum(inserted.values())}, '
+                    f'за {elapsed:.2f} с '
+                    f'({processed / elapsed:.0f} строк/с)'
+                )
+            )
+        if changed:
+            bump_version(*(VERSION_KEYS[model] for model in changed))
+
+    @staticmethod
+    def count_rows():
+        return {
+            model: model_class.objects.count()
+            for model, (model_class, _) in MODELS.items()
+        }
+
+    def read_csv(self, file, model):
+        fields = MODELS[model][1]
+        reader = csv.reader(file)
+        for row in reader:
+            if len(row) < len(fields):
+                self.stderr.write(
+                    self.style.WARNING(
+                        f'Строка {reader.line_num} пропущена: '
+                        f'ожидается полей: {len(fields)}.'
+                    )
+                )
+                continue
+            yield model, dict(zip(fields, row))
+
+    def read_json(self, file):
+        """Формат фикстур Django: первичные ключи не используются,
+        записи сопоставляются по уникальным полям."""
+        for number, item in enumerate(iter_json_array(file), 1):
+            model = item['model'].split('.')[-1]
+            if model not in MODELS:
+                raise CommandError(f'Неизвестная модель: {item["model"]}')
+            missing = set(MODELS[model][1]) - item.get('fields', {}).keys()
+            if missing:
+                self.stderr.write(
+                    self.style.WARNING(
+                        f'Запись {number} пропущена: '
+                        f'нет полей {", ".join(sorted(missing))}.'
+                    )
+                )
+                continue
+            yield model, item['fields']
+
+    @staticmethod
+    def load(rows, batch_size):
+        """Записывает строки пачками, возвращает количество
+        обработанных строк, включая уже существующие записи."""
+        batches = {model: [] for model in MODELS}
+        processed = 0
+        for model, fields in rows:
+            model_class, names = MODELS[model]
+            batch = batches[model]
+            batch.append(model_class(**{name: fields[name] for name in names}))
+            if len(batch) >= batch_size:
+                model_class.objects.bulk_create(batch, ignore_conflicts=True)
+                processed += len(batch)
+                batch.clear()
+        for model, batch in batches.items():
+            if batch:
+                MODELS[model][0].objects.bulk_create(
+                    batch, ignore_conflicts=True
+                )
+                processed += len(batch)
+        return processed
@@ -0,0 +1,73 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.cache import get_shopping_list_document
+from api.renderers import SHOPPING_LIST_RENDERERS_BY_FORMAT
+from recipes.models import ShoppingListJob
+
+
+class Command(BaseCommand):
+    help = (
+        'Формирование списков покупок из очереди '
+        'и удаление устаревших задач. Их файлы удаляет collect_media.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Обрабатывать очередь постоянно.',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1,
+            help='Пауза в секундах, когда очередь пуста.',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            processed = self.process_jobs()
+            self.delete_expired_jobs()
+            if not options['loop']:
+                break
+            if not processed:
+                time.sleep(options['interval'])
+
+    def process_jobs(self):
+        processed = 0
+        for job in ShoppingListJob.objects.filter(
+            status=ShoppingListJob.PENDING
+        ).select_related('user'):
+            # Задачу забирает только один из запущенных обработчиков.
+            if not ShoppingListJob.objects.filter(
+                pk=job.pk, status=ShoppingListJob.PENDING
+            ).update(status=ShoppingListJob.PROCESSING):
+                continue
+            try:
+                document = get_shopping_list_document(
+                    job.user, SHOPPING_LIST_RENDERERS_BY_FORMAT[job.format]()
+                )
+                job.file.save(
+                    f'{job.pk}.{job.format}',
+                    ContentFile(document),
+                    save=False,
+                )
+                job.status = ShoppingListJob.DONE
+            except Exception as error:
+                self.stderr.write(f'{job.pk}: {error}')
+                job.status = ShoppingListJob.FAILED
+            job.save(update_fields=('file', 'status'))
+            processed += 1
+        return processed
+
+    def delete_expired_jobs(self):
+        ShoppingListJob.objects.filter(
+            created__lt=timezone.now()
+            - timedelta(seconds=settings.SHOPPING_LIST_JOB_TTL)
+        ).delete()
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.cache import RECIPE_SCORES_VERSION_KEY, bump_version
+from recipes.scores import decay, refresh_popularity
+
+
+class Command(BaseCommand):
+    help = (
+        'Затухание trending и пересчёт популярности рецептов. '
+        'Запускается периодически, например раз в час.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--skip-refresh',
+            action='store_true',
+            help='Только затухание, без пересчёта popularity.',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if not options['skip_refresh']:
+                refresh_popularity()
+            decay()
+        bump_version(RECIPE_SCORES_VERSION_KEY)
+        self.stdout.write(self.style.SUCCESS('Популярность обновлена.'))
@@ -0,0 +1,87 @@
+from bisect import bisect_left
+from collections import defaultdict
+from threading import Lock
+
+
+class Histogram:
+    """Гистограмма Prometheus с меткой view, хранится в памяти процесса."""
+
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self._lock = Lock()
+        # Счётчики по корзинам и +Inf, затем сумма и количество.
+        self._values = defaultdict(lambda: [0] * (len(self.buckets) + 3))
+
+    def observe(self, view, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            values = self._values[view]
+            values[index] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def render(self):
+        with self._lock:
+            items = sorted(
+                (view, list(values)) for view, values in self._values.items()
+            )
+        lines = [
+            f'# HELP {self.name} {self.description}',
+            f'# TYPE {self.name} histogram',
+        ]
+        for view, values in items:
+            total = 0
+            for bound, count in zip((*self.buckets, '+Inf'), values):
+                total += count
+                lines.append(
+                    f'{self.name}_bucket{{view="{view}",le="{bound}"}} '
+                    f'{total}'
+                )
+            lines.append(f'{self.name}_sum{{view="{view}"}} {values[-2]}')
+            lines.append(f'{self.name}_count{{view="{view}"}} {values[-1]}')
+        return lines
+
+
+request_duration = Histogram(
+    'foodgram_request_duration_seconds',
+    'Время обработки запроса.',
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+app_duration = Histogram(
+    'foodgram_app_duration_seconds',
+    'Время обработки запроса без учёта запросов к БД: '
+    'сериализация, отрисовка ответа и остальной код.',
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+db_duration = Histogram(
+    'foodgram_db_duration_seconds',
+    'Время выполнения запросов к БД за один запрос.',
+    (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+db_queries = Histogram(
+    'foodgram_db_queries',
+    'Количество запросов к БД за один запрос.',
+    (1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+response_size = Histogram(
+    'foodgram_response_size_bytes',
+    'Размер ответа.',
+    (1024, 4 * 1024, 16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024,
+     4 * 1024 * 1024),
+)
+HISTOGRAMS = (
+    request_duration,
+    app_duration,
+    db_duration,
+    db_queries,
+    response_size,
+)
+
+
+def render_metrics():
+    """Все метрики процесса в текстовом формате Prometheus."""
+    return '\n'.join(
+        line for histogram in HISTOGRAMS for line in histogram.render()
+    ) + '\n'
@@ -0,0 +1,76 @@
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from api.metrics import (app_duration, db_duration, db_queries,
+                         request_duration, response_size)
+
+
+class QueryTimer:
+    """Считает запросы к БД и время их выполнения."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += perf_counter() - start
+            self.count += 1
+
+
+def get_view_name(view_func, method):
+    """RecipeViewSet.list, RecipeViewSet.download_shopping_cart и т.п."""
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return f'{view_func.__module__}.{view_func.__name__}'
+    action = (getattr(view_func, 'actions', None) or {}).get(method.lower())
+    if action is None:
+        return cls.__name__
+    return f'{cls.__name__}.{action}'
+
+
+class PerformanceMiddleware:
+    """Время запроса, запросы к БД и размер ответа по каждому view:
+    заголовок Server-Timing и гистограммы для /api/_metrics.
+    Отключается настройкой PERFORMANCE_METRICS."""
+
+    def __init__(self, get_response):
+        if not settings.PERFORMANCE_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        start = perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        duration = perf_counter() - start
+        view = getattr(request, 'metrics_view', 'unresolved')
+        request_duration.observe(view, duration)
+        app_duration.observe(view, duration - timer.duration)
+        db_duration.observe(view, timer.duration)
+        db_queries.observe(view, timer.count)
+        if response.streaming:
+            size = response.get('Content-Length')
+        else:
+            size = len(response.content)
+        if size is not None:
+            response_size.observe(view, int(size))
+        response['Server-Timing'] = ', '.join(
+            (
+                f'app;dur={(duration - timer.duration) * 1000:.1f}',
+                f'db;dur={timer.duration * 1000:.1f};'
+                f'desc="{timer.count} queries"',
+                f'total;dur={duration * 1000:.1f}',
+            )
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_view = get_view_name(view_func, request.method)
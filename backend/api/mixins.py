@@ -0,0 +1,40 @@
+from hashlib import md5
+
+from django.utils.cache import (get_conditional_response, patch_vary_headers,
+                                quote_etag)
+from django.utils.http import http_date
+
+
+class ConditionalListRetrieveMixin:
+    """ETag и Last-Modified для list и retrieve.
+    Если данные не изменились, отвечает 304 без сериализации."""
+
+    def get_validators(self, request, *args, **kwargs):
+        """Возвращает (ETag, Last-Modified) дешёвым запросом или из кэша.
+        Значение ETag может быть любой строкой."""
+        raise NotImplementedError
+
+    def conditional(self, method, request, *args, **kwargs):
+        etag, last_modified = self.get_validators(request, *args, **kwargs)
+        if etag is not None:
+            etag = quote_etag(md5(etag.encode()).hexdigest())
+        if last_modified is not None:
+            last_modified = int(last_modified.timestamp())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = method(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            if etag is not None:
+                response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
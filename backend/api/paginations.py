@@ -1,5 +1,72 @@
-from rest_framework.pagination import PageNumberPagination
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
+
+from recipes.timeline import after
+
+
+def is_cursor_pagination(request):
+    """Курсорная пагинация включается параметром pagination=cursor."""
+    return request.query_params.get('pagination') == 'cursor'
 
 
 class RecipesLimitPagination(PageNumberPagination):
     page_size_query_param = 'limit'
+
+
+class KeysetCursorPagination(CursorPagination):
+    """Курсор хранит ключ (pub_date, id) последнего рецепта
+    страницы, страницы идут только вперёд. Смещение не используется,
+    поэтому рецепты с одинаковым pub_date не мешают листать дальше."""
+
+    page_size_query_param = 'limit'
+    ordering = ('-pub_date', '-id')
+
+    def get_position(self, request):
+        cursor = self.decode_cursor(request)
+        if cursor is None or not cursor.position:
+            return None
+        pub_date, _, recipe_id = cursor.position.partition('|')
+        pub_date = parse_datetime(pub_date)
+        if pub_date is None or not recipe_id.isdigit():
+            raise NotFound(self.invalid_cursor_message)
+        return pub_date, int(recipe_id)
+
+    def paginate_keys(self, get_page, request, get_key=tuple):
+        """get_page(limit, position) возвращает отсортированные записи
+        страницы, следующей за position, get_key(запись) - её ключ."""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.has_previous = False
+        items = get_page(self.page_size + 1, self.get_position(request))
+        self.has_next = len(items) > self.page_size
+        items = items[:self.page_size]
+        if self.has_next:
+            pub_date, recipe_id = get_key(items[-1])
+            self.next_position = f'{pub_date.isoformat()}|{recipe_id}'
+        return items
+
+    def paginate_queryset(self, queryset, request, view=None):
+        def get_page(limit, position):
+            recipes = queryset
+            if position is not None:
+                recipes = recipes.filter(after(position, 'id'))
+            return list(recipes.order_by(*self.ordering)[:limit])
+
+        return self.paginate_keys(
+            get_page, request, lambda recipe: (recipe.pub_date, recipe.pk)
+        )
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=False, position=self.next_position)
+        )
+
+
+class SubscriptionsCursorPagination(CursorPagination):
+    page_size_query_param = 'limit'
+    ordering = ('username',)
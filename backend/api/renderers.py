@@ -0,0 +1,78 @@
+import csv
+import io
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from api.utils import create_pdf_shopping_list, shopping_list_lines
+
+
+class ShoppingListPDFRenderer(BaseRenderer):
+    """Список покупок в PDF, самый тяжёлый формат."""
+
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return create_pdf_shopping_list(
+            data['recipes'], data['ingredients']
+        ).getvalue()
+
+
+class ShoppingListTextRenderer(BaseRenderer):
+    """Список покупок простым текстом."""
+
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return '\n'.join(
+            shopping_list_lines(data['recipes'], data['ingredients'])
+        ).encode(self.charset)
+
+
+class ShoppingListCSVRenderer(BaseRenderer):
+    """Список покупок в CSV: продукт, единица измерения, количество."""
+
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(('name', 'measurement_unit', 'amount'))
+        writer.writerows(
+            (
+                ingredient['name'],
+                ingredient['measurement_unit'],
+                ingredient['amount'],
+            )
+            for ingredient in data['ingredients']
+        )
+        return buf.getvalue().encode(self.charset)
+
+
+class PrometheusRenderer(BaseRenderer):
+    """Метрики в текстовом формате Prometheus."""
+
+    media_type = 'text/plain'
+    format = 'prometheus'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, str):
+            # Ошибки, например 403, тоже отдаются текстом.
+            data = f'{data}\n'
+        return data.encode(self.charset)
+
+
+# Первый формат отдаётся, если клиент не указал нужный.
+SHOPPING_LIST_RENDERERS = (
+    ShoppingListPDFRenderer,
+    ShoppingListTextRenderer,
+    ShoppingListCSVRenderer,
+    JSONRenderer,
+)
+SHOPPING_LIST_RENDERERS_BY_FORMAT = {
+    renderer.format: renderer for renderer in SHOPPING_LIST_RENDERERS
+}
@@ -1,11 +1,18 @@
-import base64
+import binascii
+from collections import Counter
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Manager, Prefetch, prefetch_related_objects
 from djoser.serializers import UserSerializer as BaseUserSerializer
 from rest_framework import serializers
 
-from recipes.models import (AmountReceptIngredients, Ingredient, Recipe, Tag,
-                            User)
+from api.utils import decode_base64_file
+from recipes.counters import ingredient_deltas, update_ingredient_counters
+from recipes.models import (AmountReceptIngredients, Favorite, Ingredient,
+                            Recipe, ShoppingCart, ShoppingListJob,
+                            Subscription, Tag, User)
 
 
 class Base64ImageField(serializers.ImageField):
@@ -13,8 +20,46 @@ class Base64ImageField(serializers.ImageField):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
-        return super().to_internal_value(data)
+            if len(imgstr) * 3 // 4 > settings.MAX_IMAGE_SIZE:
+                raise serializers.ValidationError(
+                    'Размер изображения больше '
+                    f'{settings.MAX_IMAGE_SIZE // 1024 // 1024} МБ.'
+                )
+            try:
+                data = decode_base64_file(imgstr, name='temp.' + ext)
+            except binascii.Error:
+                raise serializers.ValidationError(
+                    'Некорректные данные изображения.'
+                )
+        image = super().to_internal_value(data)
+        if max(image.image.size) > settings.MAX_IMAGE_DIMENSION:
+            raise serializers.ValidationError(
+                'Сторона изображения больше '
+                f'{settings.MAX_IMAGE_DIMENSION} пикселей.'
+            )
+        return image
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии картинки рецепта, когда они готовы."""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        variants = recipe.image_variants
+        if not recipe.image or variants.get('source') != recipe.image.name:
+            return {}
+        request = self.context.get('request')
+        urls = {}
+        for variant in settings.IMAGE_VARIANTS:
+            if variant in variants:
+                url = default_storage.url(variants[variant])
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                urls[variant] = url
+        return urls
 
 
 def minimal_amount_tags_or_ingredients_and_check_duplicates(
@@ -25,14 +70,77 @@ def minimal_amount_tags_or_ingredients_and_check_duplicates(
             {validated_field: 'Обязательное поле.'}
         )
 
-    no_duplicate = set(ids)
-    duplicates = set(id for id in no_duplicate if ids.count(id) > 1)
+    duplicates = set(id for id, count in Counter(ids).items() if count > 1)
     if duplicates:
         raise serializers.ValidationError(
             {validated_field: f'Переданы одинаковые id: {duplicates}'}
         )
 
 
+def set_flags(objects, attr, related, field):
+    """Отмечает одним запросом объекты, id которых есть
+    в поле field записей related пользователя."""
+    objects = [obj for obj in objects if not hasattr(obj, attr)]
+    if not objects:
+        return
+    found = set(
+        related.filter(
+            **{f'{field}__in': {obj.pk for obj in objects}}
+        ).values_list(field, flat=True)
+    )
+    for obj in objects:
+        setattr(obj, attr, obj.pk in found)
+
+
+def set_subscribed(authors, user):
+    set_flags(
+        authors,
+        'is_subscribed',
+        Subscription.objects.filter(user=user),
+        'author_id',
+    )
+
+
+def set_recipe_flags(recipes, user):
+    set_flags(
+        recipes,
+        'is_favorited',
+        Favorite.objects.filter(user=user),
+        'recipe_id',
+    )
+    set_flags(
+        recipes,
+        'is_in_shopping_cart',
+        ShoppingCart.objects.filter(user=user),
+        'recipe_id',
+    )
+    set_subscribed([recipe.author for recipe in recipes], user)
+
+
+class FlagsListSerializer(serializers.ListSerializer):
+    """Отметки пользователя для всей страницы: один запрос на тип отметки
+    вместо запроса на каждый объект."""
+
+    set_user_flags = None
+
+    def to_representation(self, data):
+        if isinstance(data, Manager):
+            data = data.all()
+        data = list(data)
+        user = self.context['request'].user
+        if user.is_authenticated:
+            self.set_user_flags(data, user)
+        return super().to_representation(data)
+
+
+class UserListSerializer(FlagsListSerializer):
+    set_user_flags = staticmethod(set_subscribed)
+
+
+class RecipeListSerializer(FlagsListSerializer):
+    set_user_flags = staticmethod(set_recipe_flags)
+
+
 class UserSerializer(BaseUserSerializer):
     is_subscribed = serializers.SerializerMethodField(read_only=True)
     avatar = Base64ImageField(read_only=True)
@@ -44,11 +152,14 @@ class UserSerializer(BaseUserSerializer):
             'is_subscribed',
             'avatar',
         )
+        list_serializer_class = UserListSerializer
 
     def get_is_subscribed(self, author):
         user = self.context['request'].user
         if user.is_anonymous:
             return False
+        if hasattr(author, 'is_subscribed'):
+            return author.is_subscribed
         return author.authors.filter(user=user).exists()
 
 
@@ -87,9 +198,11 @@ class ReceptIngredientSerializer(serializers.ModelSerializer):
 
 
 class ShortRecipeSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
 class ReadRecipeSerializer(serializers.ModelSerializer):
@@ -100,6 +213,7 @@ class ReadRecipeSerializer(serializers.ModelSerializer):
     author = UserSerializer()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -112,23 +226,39 @@ class ReadRecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time',
+            'views_count',
+            'short_link_count',
         )
+        list_serializer_class = RecipeListSerializer
 
     def get_is_favorited(self, recipe):
         user = self.context['request'].user
         if user.is_anonymous:
             return False
+        if hasattr(recipe, 'is_favorited'):
+            return recipe.is_favorited
         return recipe.favorites.filter(user=user).exists()
 
     def get_is_in_shopping_cart(self, recipe):
         user = self.context['request'].user
         if user.is_anonymous:
             return False
+        if hasattr(recipe, 'is_in_shopping_cart'):
+            return recipe.is_in_shopping_cart
         return recipe.carts.filter(user=user).exists()
 
 
+class ShoppingListJobSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = ShoppingListJob
+        fields = ('id', 'format', 'status', 'file', 'created')
+        read_only_fields = fields
+
+
 class WriteIngredientSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField()
     amount = serializers.IntegerField()
@@ -159,13 +289,23 @@ class RecipeSerializer(serializers.ModelSerializer):
         )
 
     def validate(self, attrs):
-        ingredients = attrs.get('ingredients')
-        tags = attrs.get('tags')
+        ingredients = attrs.get('ingredients', [])
+        tags = attrs.get('tags', [])
+        ingredient_ids = [ingredient['id'] for ingredient in ingredients]
 
         minimal_amount_tags_or_ingredients_and_check_duplicates(
-            ids=[ingredient['id'] for ingredient in ingredients],
+            ids=ingredient_ids,
             validated_field='ingredients',
         )
+        not_found = set(ingredient_ids) - set(
+            Ingredient.objects.filter(id__in=ingredient_ids).values_list(
+                'id', flat=True
+            )
+        )
+        if not_found:
+            raise serializers.ValidationError(
+                {'ingredients': f'Продукты не найдены: {not_found}'}
+            )
 
         amount_less_zero = []
         for ingredient in ingredients:
@@ -189,6 +329,15 @@ class RecipeSerializer(serializers.ModelSerializer):
         return attrs
 
     def add_ingredients_in_recipe(self, ingredients, recipe):
+        update_ingredient_counters(
+            ingredient_deltas(
+                {},
+                {
+                    ingredient['id']: ingredient['amount']
+                    for ingredient in ingredients
+                },
+            )
+        )
         AmountReceptIngredients.objects.bulk_create(
             AmountReceptIngredients(
                 ingredient_id=ingredient['id'],
@@ -198,6 +347,46 @@ class RecipeSerializer(serializers.ModelSerializer):
             for ingredient in ingredients
         )
 
+    def update_ingredients_in_recipe(self, ingredients, recipe):
+        """Удаляет, изменяет и добавляет только отличающиеся продукты."""
+        amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        current = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in recipe.amount_ingredients.all()
+        }
+        update_ingredient_counters(
+            ingredient_deltas(
+                {
+                    ingredient_id: recipe_ingredient.amount
+                    for ingredient_id, recipe_ingredient in current.items()
+                },
+                amounts,
+            )
+        )
+        removed = current.keys() - amounts.keys()
+        if removed:
+            recipe.amount_ingredients.filter(
+                ingredient_id__in=removed
+            ).delete()
+        changed = []
+        for ingredient_id, recipe_ingredient in current.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and amount != recipe_ingredient.amount:
+                recipe_ingredient.amount = amount
+                changed.append(recipe_ingredient)
+        AmountReceptIngredients.objects.bulk_update(changed, ('amount',))
+        AmountReceptIngredients.objects.bulk_create(
+            AmountReceptIngredients(
+                ingredient_id=ingredient_id, amount=amount, recipe=recipe
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in current
+        )
+
+    @transaction.atomic
     def create(self, validated_data):
         validated_data['author'] = self.context['request'].user
         ingredients = validated_data.pop('ingredients')
@@ -207,23 +396,31 @@ class RecipeSerializer(serializers.ModelSerializer):
         self.add_ingredients_in_recipe(ingredients, recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, recipe, validated_data):
-        ingredients = validated_data.pop('ingredients', None)
-        tags = validated_data.pop('tags', None)
-        recipe.ingredients.clear()
+        ingredients = validated_data.pop('ingredients')
+        tags = validated_data.pop('tags')
         recipe.tags.set(tags)
-        self.add_ingredients_in_recipe(ingredients, recipe)
+        self.update_ingredients_in_recipe(ingredients, recipe)
         return super().update(recipe, validated_data)
 
     def to_representation(self, recipe):
+        prefetch_related_objects(
+            (recipe,),
+            'tags',
+            Prefetch(
+                'amount_ingredients',
+                queryset=AmountReceptIngredients.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+        )
         return ReadRecipeSerializer(recipe, context=self.context).data
 
 
 class SubscribeSerializer(UserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(
-        source='recipes.count',
-    )
+    recipes_count = serializers.IntegerField()
 
     class Meta(UserSerializer.Meta):
 
@@ -235,9 +432,8 @@ class SubscribeSerializer(UserSerializer):
         read_only_fields = fields
 
     def get_recipes(self, author):
-        return ShortRecipeSerializer(
-            author.recipes.all()[
-                : int(self.context['request'].GET.get('recipes_limit', 10**10))
-            ],
-            many=True,
-        ).data
+        if hasattr(author, 'limited_recipes'):
+            recipes = author.limited_recipes
+        else:
+            recipes = author.recipes.all()[: self.context['recipes_limit']]
+        return ShortRecipeSerializer(recipes, many=True).data
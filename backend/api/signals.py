@@ -0,0 +1,109 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from api.cache import (INGREDIENTS_VERSION_KEY, RECIPE_INGREDIENTS_VERSION_KEY,
+                       RECIPE_SCORES_VERSION_KEY, RECIPES_VERSION_KEY,
+                       TAGS_VERSION_KEY, USERS_VERSION_KEY, author_version_key,
+                       bump_version, cart_version_key, increment_counter,
+                       recipe_version_key, user_flags_version_key)
+from api.indexes import recipe_ingredient_index
+from recipes.models import (AmountReceptIngredients, Favorite, Ingredient,
+                            Recipe, ShoppingCart, Subscription, Tag, User)
+
+
+def bump_on_commit(*keys):
+    """Версии меняются после фиксации транзакции, иначе параллельный
+    запрос может закэшировать старые данные под новой версией."""
+    transaction.on_commit(lambda: bump_version(*keys))
+
+
+def bump_cart_versions(carts):
+    user_ids = set(carts.values_list('user_id', flat=True))
+    if user_ids:
+        bump_on_commit(*(cart_version_key(user_id) for user_id in user_ids))
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def shopping_cart_changed(sender, instance, **kwargs):
+    bump_on_commit(
+        cart_version_key(instance.user_id),
+        user_flags_version_key(instance.user_id),
+        RECIPE_SCORES_VERSION_KEY,
+    )
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+def favorite_changed(sender, instance, **kwargs):
+    bump_on_commit(
+        user_flags_version_key(instance.user_id), RECIPE_SCORES_VERSION_KEY
+    )
+
+
+@receiver((post_save, post_delete), sender=Subscription)
+def user_flags_changed(sender, instance, **kwargs):
+    bump_on_commit(user_flags_version_key(instance.user_id))
+
+
+@receiver((post_save, post_delete), sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # Вход пользователя меняет только last_login.
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        bump_on_commit(USERS_VERSION_KEY, author_version_key(instance.pk))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    bump_on_commit(TAGS_VERSION_KEY)
+
+
+# Продукты рецепта меняются только вместе с самим рецептом,
+# который сохраняется после них, поэтому отдельные сигналы
+# AmountReceptIngredients не нужны и не мешают пакетному удалению.
+def refresh_recipe_ingredients(recipe_id):
+    recipe_ingredient_index.update(
+        recipe_id,
+        AmountReceptIngredients.objects.filter(recipe_id=recipe_id)
+        .values_list('ingredient_id', flat=True),
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_changed(sender, instance, created, **kwargs):
+    bump_on_commit(recipe_version_key(instance.pk))
+    # Продукты нового рецепта записываются после его сохранения.
+    transaction.on_commit(lambda: refresh_recipe_ingredients(instance.pk))
+    if not created:
+        bump_cart_versions(ShoppingCart.objects.filter(recipe=instance))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    bump_on_commit(RECIPES_VERSION_KEY, recipe_version_key(instance.pk))
+    recipe_id = instance.pk
+    transaction.on_commit(lambda: recipe_ingredient_index.update(recipe_id))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        bump_on_commit(recipe_version_key(instance.pk))
+    else:
+        # Изменены рецепты тега, версия тегов входит в ключи всех рецептов.
+        bump_on_commit(TAGS_VERSION_KEY)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(sender, instance, created=False, **kwargs):
+    bump_on_commit(INGREDIENTS_VERSION_KEY)
+    if kwargs['signal'] is post_delete:
+        # Продукт удалён из многих рецептов сразу, индекс перестраивается.
+        transaction.on_commit(
+            lambda: increment_counter(RECIPE_INGREDIENTS_VERSION_KEY)
+        )
+    if not created:
+        bump_cart_versions(
+            ShoppingCart.objects.filter(recipe__ingredients=instance)
+        )
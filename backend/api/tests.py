@@ -0,0 +1,851 @@
+import base64
+import binascii
+import json
+import tempfile
+import time
+from datetime import timedelta
+from importlib import import_module
+from io import BytesIO, StringIO
+from unittest import skipUnless
+
+from django.apps import apps as global_apps
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from api.cache import cart_version_key, get_version
+from api.indexes import RecipeIngredientIndex, recipe_ingredient_index
+from api.serializers import Base64ImageField
+from api.utils import decode_base64_file
+from recipes.counters import recipe_views, recount
+from recipes.models import (AmountReceptIngredients, Favorite, Ingredient,
+                            Recipe, ShoppingCart, Subscription, Tag,
+                            TimelineEntry, User)
+from recipes.search import SEARCH_TABLE, match_query, search
+
+
+def create_user(number):
+    return User.objects.create(
+        email=f'user{number}@example.com',
+        username=f'user{number}',
+        first_name='Имя',
+        last_name='Фамилия',
+    )
+
+
+def create_recipe(author, number, tags, ingredients):
+    recipe = Recipe.objects.create(
+        author=author,
+        name=f'Рецепт {number}',
+        text='Описание',
+        image=f'recipe/images/{number}.png',
+        cooking_time=10,
+    )
+    recipe.tags.set(tags)
+    AmountReceptIngredients.objects.bulk_create(
+        AmountReceptIngredients(recipe=recipe, ingredient=ingredient, amount=1)
+        for ingredient in ingredients
+    )
+    return recipe
+
+
+class QueryBudgetTest(TestCase):
+    """Количество запросов к БД не зависит от размера страницы
+    и количества связанных записей."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(0)
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}')
+            for number in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Продукт {number}', measurement_unit='г'
+            )
+            for number in range(6)
+        ]
+        cls.authors = [create_user(number) for number in range(1, 9)]
+        for number, author in enumerate(cls.authors):
+            Subscription.objects.create(user=cls.user, author=author)
+            for recipe_number in range(2):
+                recipe = create_recipe(
+                    author,
+                    f'{number}-{recipe_number}',
+                    cls.tags,
+                    cls.ingredients,
+                )
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        cls.small_recipe = create_recipe(
+            cls.user, 'small', cls.tags[:1], cls.ingredients[:1]
+        )
+        cls.large_recipe = create_recipe(
+            cls.user, 'large', cls.tags, cls.ingredients
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        # Просмотры записываются, пока тестовая БД существует.
+        recipe_views.flush()
+
+    def assert_budget(self, queries, url, cached=False, **params):
+        """Запросы к БД при пустом кэше, если не сказано иное."""
+        if not cached:
+            cache.clear()
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_recipe_list(self):
+        for limit in (2, 8):
+            with self.subTest(limit=limit):
+                response = self.assert_budget(
+                    9, '/api/recipes/', limit=limit
+                )
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_recipe_list_cursor(self):
+        for limit in (2, 8):
+            with self.subTest(limit=limit):
+                self.assert_budget(
+                    8, '/api/recipes/', limit=limit, pagination='cursor'
+                )
+
+    def test_recipe_detail(self):
+        for recipe in (self.small_recipe, self.large_recipe):
+            with self.subTest(recipe=recipe.name):
+                self.assert_budget(5, f'/api/recipes/{recipe.pk}/')
+                # Общая часть карточки берётся из кэша.
+                self.assert_budget(
+                    2, f'/api/recipes/{recipe.pk}/', cached=True
+                )
+
+    def test_subscriptions(self):
+        for limit, recipes_limit in ((2, 1), (8, 3)):
+            with self.subTest(limit=limit):
+                response = self.assert_budget(
+                    3,
+                    '/api/users/subscriptions/',
+                    limit=limit,
+                    recipes_limit=recipes_limit,
+                )
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_user_list(self):
+        for limit in (2, 8):
+            with self.subTest(limit=limit):
+                response = self.assert_budget(3, '/api/users/', limit=limit)
+                self.assertEqual(len(response.data['results']), limit)
+
+
+class SubscriptionRecipesTest(TestCase):
+    """Рецепты подписок выбираются за время, не зависящее
+    от количества рецептов автора сверх recipes_limit."""
+
+    AUTHORS, RECIPES = 3, 10_000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(0)
+        for number in range(1, cls.AUTHORS + 1):
+            author = create_user(number)
+            Subscription.objects.create(user=cls.user, author=author)
+            # bulk_create не вызывает сигналы рецепта.
+            Recipe.objects.bulk_create(
+                (
+                    Recipe(
+                        author=author,
+                        name=f'Рецепт {recipe_number:05}',
+                        text='Описание',
+                        image='recipe/images/recipe.png',
+                        cooking_time=10,
+                    )
+                    for recipe_number in reversed(range(cls.RECIPES))
+                ),
+                batch_size=1000,
+            )
+            User.objects.filter(pk=author.pk).update(
+                recipes_count=cls.RECIPES
+            )
+
+    def test_recipes_limit(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        started = time.monotonic()
+        with self.assertNumQueries(3):
+            response = client.get(
+                '/api/users/subscriptions/', {'recipes_limit': 2}
+            )
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(len(response.data['results']), self.AUTHORS)
+        for author in response.data['results']:
+            self.assertEqual(
+                [recipe['name'] for recipe in author['recipes']],
+                ['Рецепт 00000', 'Рецепт 00001'],
+            )
+            self.assertEqual(author['recipes_count'], self.RECIPES)
+
+    def test_subscribe(self):
+        client = APIClient()
+        client.force_authenticate(create_user(self.AUTHORS + 1))
+        author = User.objects.get(username='user1')
+        response = client.post(
+            f'/api/users/{author.pk}/subscribe/?recipes_limit=1'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [recipe['name'] for recipe in response.data['recipes']],
+            ['Рецепт 00000'],
+        )
+
+
+def create_image(size, format='PNG'):
+    buf = BytesIO()
+    Image.new('RGB', size, 'red').save(buf, format)
+    return buf.getvalue()
+
+
+class Base64ImageTest(SimpleTestCase):
+    def to_internal_value(self, content):
+        data = base64.encodebytes(content).decode()
+        return Base64ImageField().to_internal_value(
+            f'data:image/png;base64,{data}'
+        )
+
+    def test_decode_with_line_breaks(self):
+        """Части, на которые режутся данные, не совпадают
+        с границами групп base64 из-за переводов строк."""
+        content = create_image((300, 200))
+        for chunk_size in (7, 64, 1000):
+            with self.subTest(chunk_size=chunk_size):
+                file = decode_base64_file(
+                    base64.encodebytes(content).decode(),
+                    name='image.png',
+                    chunk_size=chunk_size,
+                )
+                self.assertEqual(file.read(), content)
+
+    def test_invalid_data(self):
+        for data in ('abc', 'ab!d'):
+            with self.subTest(data=data):
+                with self.assertRaises(binascii.Error):
+                    decode_base64_file(data, name='image.png')
+
+    def test_image(self):
+        image = self.to_internal_value(create_image((300, 200)))
+        self.assertEqual(image.image.size, (300, 200))
+
+    @override_settings(MAX_IMAGE_SIZE=1024)
+    def test_size_limit(self):
+        content = create_image((1000, 1000), 'BMP')
+        with self.assertRaisesMessage(ValidationError, 'Размер'):
+            self.to_internal_value(content)
+
+    @override_settings(MAX_IMAGE_DIMENSION=100)
+    def test_dimension_limit(self):
+        for size in ((101, 10), (10, 101)):
+            with self.subTest(size=size):
+                with self.assertRaisesMessage(ValidationError, 'Сторона'):
+                    self.to_internal_value(create_image(size))
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(0)
+        cls.recipe = create_recipe(cls.user, 0, (), ())
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        recipe_views.flush()
+
+    def assert_revalidated(self, url):
+        """После добавления в избранное ответ не 304,
+        даже если клиент передал только If-Modified-Since."""
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=self.user, recipe=self.recipe)
+        for headers in (
+            {'HTTP_IF_NONE_MATCH': etag},
+            {'HTTP_IF_MODIFIED_SINCE': 'Fri, 01 Jan 2100 00:00:00 GMT'},
+        ):
+            response = self.client.get(url, **headers)
+            self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_recipe_list(self):
+        data = self.assert_revalidated('/api/recipes/')
+        self.assertTrue(data['results'][0]['is_favorited'])
+
+    def test_recipe_detail(self):
+        data = self.assert_revalidated(f'/api/recipes/{self.recipe.pk}/')
+        self.assertTrue(data['is_favorited'])
+
+    def test_recipe_list_counters(self):
+        """Записанные просмотры и переходы по короткой ссылке
+        меняют ETag списка."""
+        etag = self.client.get('/api/recipes/')['ETag']
+        for field in ('views_count', 'short_link_count'):
+            with self.subTest(field):
+                Recipe.objects.filter(pk=self.recipe.pk).update(
+                    **{field: F(field) + 1}
+                )
+                response = self.client.get(
+                    '/api/recipes/', HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data['results'][0][field], 1)
+                etag = response['ETag']
+
+    def test_recipe_detail_views(self):
+        """Ответ 304 тоже считается просмотром, а записанные
+        просмотры меняют ETag."""
+        url = f'/api/recipes/{self.recipe.pk}/'
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        recipe_views.flush()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['views_count'], 2)
+
+
+class LoadDataTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_loaded_tags_are_served(self):
+        etag = self.client.get('/api/tags/')['ETag']
+        response = self.client.get('/api/recipes/', {'tags': 'breakfast'})
+        self.assertEqual(response.status_code, 400)
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as file:
+            json.dump(
+                [
+                    {
+                        'model': 'recipes.tag',
+                        'fields': {'name': 'Завтрак', 'slug': 'breakfast'},
+                    }
+                ],
+                file,
+            )
+            file.flush()
+            call_command('load_data', file.name, stdout=StringIO())
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['slug'], 'breakfast')
+        response = self.client.get('/api/recipes/', {'tags': 'breakfast'})
+        self.assertEqual(response.status_code, 200)
+
+
+class CartVersionTest(TestCase):
+    def test_version_changes_after_commit(self):
+        """До фиксации транзакции список покупок не кэшируется
+        под новой версией корзины."""
+        cache.clear()
+        user = create_user(0)
+        ingredient = Ingredient.objects.create(
+            name='Продукт', measurement_unit='г'
+        )
+        recipe = create_recipe(user, 0, (), (ingredient,))
+        ShoppingCart.objects.create(user=user, recipe=recipe)
+        version = get_version(cart_version_key(user.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient.measurement_unit = 'кг'
+            ingredient.save()
+            self.assertEqual(get_version(cart_version_key(user.pk)), version)
+        self.assertNotEqual(get_version(cart_version_key(user.pk)), version)
+
+
+class FeedTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(0)
+        cls.author = create_user(1)
+        cls.popular_author = create_user(2)
+        now = timezone.now()
+        cls.recipes = []
+        for number in range(8):
+            author = cls.popular_author if number % 3 else cls.author
+            recipe = create_recipe(author, number, (), ())
+            Recipe.objects.filter(pk=recipe.pk).update(
+                pub_date=now - timedelta(minutes=number)
+            )
+            cls.recipes.append(recipe.pk)
+        create_recipe(create_user(3), 'other', (), ())
+        Subscription.objects.create(user=cls.user, author=cls.author)
+        Subscription.objects.create(user=cls.user, author=cls.popular_author)
+        # Рецепты автора с большим числом подписчиков читаются
+        # из таблицы рецептов, а не из ленты.
+        TimelineEntry.objects.filter(author=cls.popular_author).delete()
+        User.objects.filter(pk=cls.popular_author.pk).update(
+            subscribers_count=10 ** 6
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_pages_merge_timeline_and_popular_authors(self):
+        recipes = []
+        url = '/api/recipes/feed/?limit=3'
+        while url:
+            with self.assertNumQueries(9):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            recipes += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(recipes, self.recipes)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/recipes/feed/', {'cursor': 'x'})
+        self.assertEqual(response.status_code, 404)
+
+
+class RecipeCursorPaginationTest(TestCase):
+    """Курсор продолжает страницы рецептов с одинаковым pub_date,
+    даже если их больше offset_cutoff курсора DRF."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user(0)
+        pub_date = timezone.now()
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=author,
+                name=f'Рецепт {number}',
+                text='Описание',
+                image='recipe/images/recipe.png',
+                cooking_time=10,
+            )
+            for number in range(1005)
+        )
+        Recipe.objects.update(pub_date=pub_date)
+        cls.recipes = list(
+            Recipe.objects.order_by('-id').values_list('id', flat=True)
+        )
+
+    def test_pages_with_equal_pub_date(self):
+        recipes = []
+        url = '/api/recipes/?pagination=cursor&limit=1000'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(response.data['previous'])
+            recipes += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(recipes, self.recipes)
+
+    def test_legacy_pub_dates_become_distinct(self):
+        migration = import_module(
+            'recipes.migrations.0017_recipe_distinct_pub_date'
+        )
+        migration.make_pub_dates_distinct(global_apps, None)
+        self.assertEqual(
+            list(
+                Recipe.objects.order_by('-pub_date').values_list(
+                    'id', flat=True
+                )
+            ),
+            self.recipes,
+        )
+
+
+class TagFilterTest(TestCase):
+    RECIPES, TAGS = 100_000, 20
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user(0)
+        tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}')
+            for number in range(cls.TAGS)
+        ]
+        # bulk_create не вызывает сигналы рецепта.
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author=author,
+                    name=f'Рецепт {number}',
+                    text='Описание',
+                    image='recipe/images/recipe.png',
+                    cooking_time=10,
+                )
+                for number in range(cls.RECIPES)
+            ),
+            batch_size=1000,
+        )
+        cls.recipes = list(
+            Recipe.objects.order_by('id').values_list('id', flat=True)
+        )
+        # У рецепта два соседних тега: number и number + 1.
+        Recipe.tags.through.objects.bulk_create(
+            (
+                Recipe.tags.through(
+                    recipe_id=recipe_id,
+                    tag_id=tags[(number + shift) % cls.TAGS].pk,
+                )
+                for number, recipe_id in enumerate(cls.recipes)
+                for shift in range(2)
+            ),
+            batch_size=1000,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_recipe_with_two_tags_appears_once(self):
+        response = self.client.get(
+            '/api/recipes/',
+            {'tags': ['tag0', 'tag1'], 'limit': 60},
+        )
+        self.assertEqual(response.status_code, 200)
+        ids = [recipe['id'] for recipe in response.data['results']]
+        self.assertEqual(len(ids), len(set(ids)))
+        # Теги 0 и 1 есть у рецептов с номерами 19, 0 и 1 по модулю 20.
+        self.assertEqual(response.data['count'], self.RECIPES * 3 // 20)
+        self.assertEqual(len(ids), 60)
+
+    def test_benchmark(self):
+        """Страница фильтра по тегам на 100 тысячах рецептов."""
+        started = time.monotonic()
+        response = self.client.get(
+            '/api/recipes/', {'tags': ['tag0', 'tag1'], 'limit': 10}
+        )
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(len(response.data['results']), 10)
+
+
+class RecipeUpdateTest(TestCase):
+    """Изменение рецепта меняет только отличающиеся строки продуктов
+    и поддерживает счётчики продуктов в актуальном состоянии."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user(0)
+        cls.tag = Tag.objects.create(name='Тег', slug='tag')
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Продукт {number}', measurement_unit='г'
+            )
+            for number in range(201)
+        ]
+        cls.recipe = create_recipe(
+            cls.author, 0, (cls.tag,), cls.ingredients[:3]
+        )
+        recount()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def update(self, amounts):
+        return self.client.patch(
+            f'/api/recipes/{self.recipe.pk}/',
+            {
+                'tags': [self.tag.pk],
+                'ingredients': [
+                    {'id': ingredient_id, 'amount': amount}
+                    for ingredient_id, amount in amounts.items()
+                ],
+            },
+            format='json',
+        )
+
+    def get_rows(self):
+        return {
+            row.ingredient_id: (row.pk, row.amount)
+            for row in self.recipe.amount_ingredients.all()
+        }
+
+    def get_counters(self):
+        return list(
+            Ingredient.objects.order_by('pk').values_list(
+                'recipes_count', 'amount_total'
+            )
+        )
+
+    def test_only_changed_rows_are_written(self):
+        removed, changed, kept = self.ingredients[:3]
+        new = self.ingredients[3]
+        rows = self.get_rows()
+        response = self.update({changed.pk: 5, kept.pk: 1, new.pk: 2})
+        self.assertEqual(response.status_code, 200)
+        updated = self.get_rows()
+        self.assertEqual(updated.keys(), {changed.pk, kept.pk, new.pk})
+        self.assertEqual(updated[changed.pk], (rows[changed.pk][0], 5))
+        self.assertEqual(updated[kept.pk], rows[kept.pk])
+        self.assertEqual(updated[new.pk][1], 2)
+        counters = self.get_counters()
+        self.assertEqual(counters[:4], [(0, 0), (1, 5), (1, 1), (1, 2)])
+        recount()
+        self.assertEqual(self.get_counters(), counters)
+
+    def test_unknown_ingredient(self):
+        rows = self.get_rows()
+        counters = self.get_counters()
+        missing = self.ingredients[-1].pk + 1
+        response = self.update({self.ingredients[0].pk: 1, missing: 1})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ingredients', response.data)
+        self.assertEqual(self.get_rows(), rows)
+        self.assertEqual(self.get_counters(), counters)
+
+    def test_benchmark(self):
+        """Количество запросов не зависит от количества продуктов,
+        рецепт из 200 продуктов изменяется быстро."""
+        queries = {}
+        for count in (10, 200):
+            ingredients = self.ingredients[:count]
+            self.update({ingredient.pk: 1 for ingredient in ingredients})
+            # Первый продукт удаляется, остальные меняются,
+            # последний добавляется.
+            amounts = {ingredient.pk: 2 for ingredient in ingredients[1:]}
+            amounts[self.ingredients[count].pk] = 1
+            started = time.monotonic()
+            with CaptureQueriesContext(connection) as context:
+                response = self.update(amounts)
+            self.assertLess(time.monotonic() - started, 2)
+            self.assertEqual(response.status_code, 200)
+            queries[count] = len(context)
+        self.assertEqual(queries[10], queries[200])
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = create_user(0)
+        self.potato = Ingredient.objects.create(
+            name='Картофель', measurement_unit='г'
+        )
+
+    def create_recipe(self, name, text='Описание', ingredients=()):
+        # Без картинки не запускается построение уменьшенных копий.
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                author=self.author, name=name, text=text, cooking_time=10
+            )
+            AmountReceptIngredients.objects.bulk_create(
+                AmountReceptIngredients(
+                    recipe=recipe, ingredient=ingredient, amount=1
+                )
+                for ingredient in ingredients
+            )
+        return recipe
+
+    def search(self, query):
+        return list(search(Recipe.objects.all(), query).order_by('id'))
+
+    def get(self, query, **params):
+        return self.client.get('/api/recipes/', {'search': query, **params})
+
+    def test_match_query(self):
+        self.assertEqual(
+            match_query('Ёжик "в" NEAR(тумане'),
+            '"ежик" """в""" "near(тумане"*',
+        )
+
+    def test_fts_syntax_is_quoted(self):
+        recipe = self.create_recipe('Суп "харчо"')
+        for query in ('"харчо', 'суп AND', 'NEAR(суп', 'харчо*', '-суп'):
+            with self.subTest(query=query):
+                response = self.get(query)
+                self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.search('"харчо'), [recipe])
+
+    @skipUnless(connection.vendor == 'sqlite', 'Префиксы ищет только FTS5.')
+    def test_prefix(self):
+        recipe = self.create_recipe('Ёлочка из картофеля')
+        self.assertEqual(self.search('елочка карто'), [recipe])
+        self.assertEqual(self.search('карто елочка'), [])
+
+    def test_ranking(self):
+        """Совпадение в названии важнее, чем в продуктах,
+        а в продуктах важнее, чем в описании."""
+        in_text = self.create_recipe('Пюре', text='Картофель и масло')
+        in_name = self.create_recipe('Картофель по-деревенски')
+        in_ingredients = self.create_recipe('Пюре', ingredients=[self.potato])
+        response = self.get('картофель')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [in_name.pk, in_ingredients.pk, in_text.pk],
+        )
+
+    def test_reindex_on_save(self):
+        recipe = self.create_recipe('Борщ')
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.name = 'Щи'
+            recipe.save()
+        self.assertEqual(self.search('борщ'), [])
+        self.assertEqual(self.search('щи'), [recipe])
+
+    def test_reindex_on_ingredient_rename(self):
+        recipe = self.create_recipe('Пюре', ingredients=[self.potato])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.potato.name = 'Батат'
+            self.potato.save()
+        self.assertEqual(self.search('картофель'), [])
+        self.assertEqual(self.search('батат'), [recipe])
+
+    def test_remove_on_delete(self):
+        recipe = self.create_recipe('Борщ')
+        recipe_id = recipe.pk
+        recipe.delete()
+        column = 'recipe_id' if connection.vendor == 'postgresql' else 'rowid'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT COUNT(*) FROM {SEARCH_TABLE} WHERE {column} = %s',
+                (recipe_id,),
+            )
+            self.assertEqual(cursor.fetchone(), (0,))
+
+    def test_cursor_pagination_is_rejected(self):
+        self.create_recipe('Борщ')
+        response = self.get('борщ', pagination='cursor')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('search', response.data)
+
+
+class WhatToCookTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = create_user(0)
+        self.first, self.second, self.third = (
+            Ingredient.objects.create(
+                name=f'Продукт {number}', measurement_unit='г'
+            )
+            for number in range(3)
+        )
+        self.both = create_recipe(author, 0, (), (self.first, self.second))
+        self.all = create_recipe(
+            author, 1, (), (self.first, self.second, self.third)
+        )
+        self.other = create_recipe(author, 2, (), (self.third,))
+
+    def tearDown(self):
+        recipe_views.flush()
+
+    def find(self, *ingredients):
+        return [
+            recipe_id
+            for recipe_id, _, _ in recipe_ingredient_index.find(
+                ingredient.pk for ingredient in ingredients
+            )
+        ]
+
+    def set_ingredients(self, recipe, *ingredients, index=None):
+        """Изменение продуктов рецепта процессом, которому
+        принадлежит index."""
+        index = index or recipe_ingredient_index
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.amount_ingredients.all().delete()
+            AmountReceptIngredients.objects.bulk_create(
+                AmountReceptIngredients(
+                    recipe=recipe, ingredient=ingredient, amount=1
+                )
+                for ingredient in ingredients
+            )
+            transaction.on_commit(
+                lambda: index.update(
+                    recipe.pk, [ingredient.pk for ingredient in ingredients]
+                )
+            )
+
+    def test_what_to_cook(self):
+        response = self.client.get(
+            '/api/recipes/what_to_cook/',
+            {'ingredients': f'{self.first.pk},{self.second.pk}'},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [
+                (
+                    recipe['id'],
+                    recipe['coverage'],
+                    recipe['missing_ingredients'],
+                )
+                for recipe in response.data['results']
+            ],
+            [(self.both.pk, 1.0, 0), (self.all.pk, 0.667, 1)],
+        )
+
+    def test_invalid_ingredients(self):
+        response = self.client.get(
+            '/api/recipes/what_to_cook/', {'ingredients': '1,x'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_incremental_update(self):
+        """Изменение этого процесса применяется без перестройки."""
+        self.assertEqual(self.find(self.first), [self.both.pk, self.all.pk])
+        self.set_ingredients(self.other, self.first)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.find(self.first),
+                [self.other.pk, self.both.pk, self.all.pk],
+            )
+
+    def test_other_process_update(self):
+        self.assertEqual(self.find(self.third), [self.other.pk, self.all.pk])
+        self.set_ingredients(
+            self.other, self.first, index=RecipeIngredientIndex()
+        )
+        with self.assertNumQueries(1):
+            self.assertEqual(self.find(self.third), [self.all.pk])
+
+    def test_non_atomic_incr(self):
+        """Если incr кэша не атомарен, индекс перестраивается
+        после каждого изменения."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        backend = 'django.core.cache.backends.filebased.FileBasedCache'
+        with override_settings(
+            CACHES={
+                'default': {'BACKEND': backend, 'LOCATION': directory.name}
+            }
+        ):
+            self.assertEqual(
+                self.find(self.third), [self.other.pk, self.all.pk]
+            )
+            self.set_ingredients(self.other, self.first)
+            with self.assertNumQueries(1):
+                self.assertEqual(self.find(self.third), [self.all.pk])
+
+
+class RecipeOrderingTest(TestCase):
+    def test_popular(self):
+        cache.clear()
+        users = [create_user(number) for number in range(2)]
+        first, second, third = (
+            create_recipe(users[0], number, (), ()) for number in range(3)
+        )
+        for user in users:
+            Favorite.objects.create(user=user, recipe=second)
+        ShoppingCart.objects.create(user=users[0], recipe=first)
+        response = self.client.get('/api/recipes/', {'ordering': 'popular'})
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [second.pk, first.pk, third.pk],
+        )
@@ -1,7 +1,8 @@
 from django.conf import settings
 from django.urls import include, path
 
-from api.views import IngredientVeiwSet, RecipeViewSet, TagViewSet, UserViewSet
+from api.views import (IngredientVeiwSet, MetricsView, RecipeViewSet,
+                       TagViewSet, UserViewSet)
 
 if settings.DEBUG:
     from rest_framework.routers import DefaultRouter as Router
@@ -19,4 +20,5 @@ router.register(r'users', UserViewSet, basename='users')
 urlpatterns = [
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
+    path('_metrics', MetricsView.as_view(), name='metrics'),
 ]
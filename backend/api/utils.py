@@ -1,40 +1,96 @@
+import base64
+import binascii
 import io
+from itertools import chain
+from tempfile import SpooledTemporaryFile
 
+from django.conf import settings
+from django.core.files import File
 from django.utils import timezone
 from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import simpleSplit
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen import canvas
 
+FONT_NAME = 'DejaVuSans'
+FONT_FILE = 'DejaVuSans.ttf'
+FONT_SIZE = 14
+LEADING = FONT_SIZE * 1.2
+MARGIN = 20
+PAGE_WIDTH, PAGE_HEIGHT = letter
+LINES_PER_PAGE = int((PAGE_HEIGHT - 2 * MARGIN) // LEADING)
+
+
+def decode_base64_file(data, name, chunk_size=64 * 1024):
+    """Декодирование base64 частями во временный файл,
+    большие файлы не держатся в памяти целиком. Пробелы и переводы
+    строк пропускаются, а символы сверх кратного четырём
+    переносятся в следующую часть."""
+    file = SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+    )
+    rest = ''
+    for start in range(0, len(data), chunk_size):
+        chunk = rest + ''.join(data[start:start + chunk_size].split())
+        end = len(chunk) - len(chunk) % 4
+        file.write(base64.b64decode(chunk[:end], validate=True))
+        rest = chunk[end:]
+    if rest:
+        raise binascii.Error('Длина base64 не кратна четырём.')
+    file.seek(0)
+    return File(file, name=name)
+
+
+def register_fonts():
+    """Регистрация шрифтов для PDF, выполняется один раз при запуске."""
+    pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_FILE))
+
+
+def shopping_list_lines(recipes, ingridients):
+    """Строки списка покупок."""
+    ingridients = iter(ingridients)
+    first = next(ingridients, None)
+    if first is None:
+        yield 'Список покупок пуст!'
+        return
+    yield f'Список покупок на {timezone.now().date()}:'
+    yield ''
+    for ingridient in chain((first,), ingridients):
+        yield (
+            f'{ingridient["name"].capitalize()}'
+            f'({ingridient["measurement_unit"]}):'
+            f' {ingridient["amount"]}'
+        )
+    yield '-----' * 25
+    yield 'Используются в рецептах:'
+    yield from recipes
+
+
+def wrap_lines(lines):
+    """Перенос строк, не помещающихся по ширине страницы."""
+    for line in lines:
+        yield from simpleSplit(
+            line, FONT_NAME, FONT_SIZE, PAGE_WIDTH - 2 * MARGIN
+        ) or ('',)
+
 
 def create_pdf_shopping_list(recipes, ingridients):
     """Скачивание файла со списком и количеством продуктов."""
     buf = io.BytesIO()
     c = canvas.Canvas(buf, pagesize=letter, bottomup=0)
-    text = c.beginText()
-    text.setTextOrigin(20, 20)
-    pdfmetrics.registerFont(TTFont('DejaVuSans', 'DejaVuSans.ttf'))
-    text.setFont('DejaVuSans', 14)
-    recipes_cart = [f'{recipe.recipe.name}' for recipe in recipes]
-    if ingridients:
-        ingridients_cart = [
-            (
-                f'{ingridient["name"].capitalize()}'
-                f'({ingridient["measurement_unit"]}):'
-                f' {ingridient["amount"]}'
-            )
-            for ingridient in ingridients
-        ]
-        recipes_cart = '\n'.join(recipes_cart)
-        text.textLine(f'Список покупок на {timezone.now().date()}:')
-        ingridients_cart = '\n'.join(ingridients_cart)
-        text.textLine('')
-        text.textLines(ingridients_cart)
-        text.textLine('-----' * 25)
-        text.textLine('Используются в рецептах:')
-        text.textLines(recipes_cart)
-    else:
-        text.textLine('Список покупок пуст!')
+    text = None
+    for number, line in enumerate(
+        wrap_lines(shopping_list_lines(recipes, ingridients))
+    ):
+        if number % LINES_PER_PAGE == 0:
+            if text is not None:
+                c.drawText(text)
+                c.showPage()
+            text = c.beginText()
+            text.setTextOrigin(MARGIN, MARGIN)
+            text.setFont(FONT_NAME, FONT_SIZE, LEADING)
+        text.textLine(line)
     c.drawText(text)
     c.showPage()
     c.save()
@@ -1,6 +1,13 @@
+import io
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import FileResponse
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import (BooleanField, Exists, Max, OuterRef, Prefetch,
+                              Sum, Value)
+from django.db.models.expressions import RawSQL
+from django.http import FileResponse, Http404, JsonResponse
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
 from django_filters.rest_framework import DjangoFilterBackend
@@ -8,31 +15,62 @@ from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import permissions, serializers, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from api.cache import (INGREDIENTS_VERSION_KEY, RECIPE_SCORES_VERSION_KEY,
+                       RECIPES_VERSION_KEY, TAGS_VERSION_KEY,
+                       USERS_VERSION_KEY, get_shopping_list_document,
+                       get_version, recipe_detail_key, recipe_version_key,
+                       user_flags_version_key)
 from api.filters import IngredientFilter, RecipesFilter
-from api.paginations import RecipesLimitPagination
+from api.indexes import ingredient_index, recipe_ingredient_index
+from api.metrics import render_metrics
+from api.mixins import ConditionalListRetrieveMixin
+from api.paginations import (KeysetCursorPagination, RecipesLimitPagination,
+                             SubscriptionsCursorPagination,
+                             is_cursor_pagination)
 from api.permissions import ReadOrAuthorChangeRecipt
+from api.renderers import SHOPPING_LIST_RENDERERS, PrometheusRenderer
 from api.serializers import (AvatarSerializer, IngredientSerializer,
                              ReadRecipeSerializer, RecipeSerializer,
-                             ShortRecipeSerializer, SubscribeSerializer,
-                             TagSerializer, UserSerializer)
-from api.utils import create_pdf_shopping_list
-from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                             ShoppingListJobSerializer, ShortRecipeSerializer,
+                             SubscribeSerializer, TagSerializer,
+                             UserSerializer)
+from recipes.counters import recipe_views
+from recipes.models import (AmountReceptIngredients, Favorite, Ingredient,
+                            Recipe, ShoppingCart, ShoppingListJob,
                             Subscription, Tag)
+from recipes.timeline import get_feed
 
 User = get_user_model()
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class MetricsView(APIView):
+    """Метрики производительности процесса для Prometheus."""
+
+    permission_classes = (permissions.IsAdminUser,)
+    renderer_classes = (PrometheusRenderer,)
+
+    def get(self, request):
+        return Response(render_metrics())
+
+
+class TagViewSet(ConditionalListRetrieveMixin, viewsets.ReadOnlyModelViewSet):
     """Получение информации о тегах."""
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
+    def get_validators(self, request, *args, **kwargs):
+        return get_version(TAGS_VERSION_KEY), None
+
 
-class IngredientVeiwSet(viewsets.ReadOnlyModelViewSet):
+class IngredientVeiwSet(
+    ConditionalListRetrieveMixin, viewsets.ReadOnlyModelViewSet
+):
     """Получение информации об ингридиентах.
     Возможен поиск по имени рецепту."""
 
@@ -42,8 +80,27 @@ class IngredientVeiwSet(viewsets.ReadOnlyModelViewSet):
     search_fields = ('^name',)
     pagination_class = None
 
+    def get_validators(self, request, *args, **kwargs):
+        return get_version(INGREDIENTS_VERSION_KEY), None
+
+    def list(self, request, *args, **kwargs):
+        """Список и поиск продуктов обслуживаются из индекса в памяти."""
+        return self.conditional(
+            self.list_from_index, request, *args, **kwargs
+        )
+
+    def list_from_index(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return Response(
+                ingredient_index.search(
+                    name, settings.INGREDIENTS_SEARCH_LIMIT
+                )
+            )
+        return Response(ingredient_index.all())
+
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalListRetrieveMixin, viewsets.ModelViewSet):
     """Получение, изменение или удаление рецепта.
     Так же сюда относится корзина, избранное и скачивание файла.
     """
@@ -56,6 +113,159 @@ class RecipeViewSet(viewsets.ModelViewSet):
         ReadOrAuthorChangeRecipt,
     )
 
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator') and is_cursor_pagination(
+            self.request
+        ):
+            self._paginator = KeysetCursorPagination()
+        return super().paginator
+
+    def get_queryset(self):
+        """Рецепты со всеми связанными данными для чтения.
+        Количество запросов не зависит от размера страницы."""
+        recipes = super().get_queryset()
+        if self.request.method != 'GET':
+            return recipes
+        # Отметки пользователя загружает RecipeListSerializer.
+        return self.with_related(recipes).select_related('author')
+
+    @staticmethod
+    def with_related(recipes):
+        return recipes.prefetch_related(
+            'tags',
+            Prefetch(
+                'amount_ingredients',
+                queryset=AmountReceptIngredients.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+        )
+
+    def retrieve(self, request, pk=None, *args, **kwargs):
+        response = self.conditional(
+            self.retrieve_cached, request, pk, *args, **kwargs
+        )
+        # Просмотр учитывается и при ответе 304.
+        if response.status_code in (200, 304):
+            recipe_views.add(int(pk))
+        return response
+
+    def retrieve_cached(self, request, pk=None, *args, **kwargs):
+        """Общая часть рецепта берётся из кэша, а отметки пользователя
+        загружаются одним запросом вместе с проверкой рецепта."""
+        user = request.user
+        try:
+            recipe = Recipe.objects.filter(pk=pk)
+        except ValueError:
+            raise Http404
+        flags = ('is_favorited', 'is_in_shopping_cart', 'is_subscribed')
+        # Счётчики часто меняются и в кэш не попадают.
+        counters = ('views_count', 'short_link_count')
+        if user.is_authenticated:
+            recipe = recipe.annotate(
+                is_favorited=Exists(
+                    Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+                ),
+                is_in_shopping_cart=Exists(
+                    ShoppingCart.objects.filter(
+                        user=user, recipe=OuterRef('pk')
+                    )
+                ),
+                is_subscribed=Exists(
+                    Subscription.objects.filter(
+                        user=user, author=OuterRef('author')
+                    )
+                ),
+            )
+        else:
+            recipe = recipe.annotate(
+                **{flag: Value(False, BooleanField()) for flag in flags}
+            )
+        try:
+            recipe = recipe.values(
+                'author_id', 'updated_at', *counters, *flags
+            ).get()
+        except Recipe.DoesNotExist:
+            raise Http404
+        key = recipe_detail_key(
+            pk,
+            recipe['author_id'],
+            recipe['updated_at'],
+            request.build_absolute_uri('/'),
+        )
+        data = cache.get(key)
+        if data is None:
+            instance = get_object_or_404(
+                self.with_related(Recipe.objects.select_related('author')),
+                pk=pk,
+            )
+            instance.is_favorited = instance.is_in_shopping_cart = False
+            instance.author.is_subscribed = False
+            data = ReadRecipeSerializer(
+                instance, context=self.get_serializer_context()
+            ).data
+            cache.set(key, data, settings.RECIPE_DETAIL_CACHE_TIMEOUT)
+        return Response(
+            {
+                **data,
+                'author': {
+                    **data['author'],
+                    'is_subscribed': recipe['is_subscribed'],
+                },
+                'is_favorited': recipe['is_favorited'],
+                'is_in_shopping_cart': recipe['is_in_shopping_cart'],
+                **{counter: recipe[counter] for counter in counters},
+            }
+        )
+
+    def get_validators(self, request, pk=None, *args, **kwargs):
+        """Время изменения рецептов и версии всех данных,
+        которые попадают в ответ, в том числе данных пользователя.
+        Last-Modified не отдаётся: отметки пользователя и удаление
+        рецептов не меняют время изменения рецептов."""
+        if pk is None:
+            # Удаление рецепта меняет RECIPES_VERSION_KEY,
+            # поэтому считать рецепты не нужно. Счётчики входят в ответ
+            # и только растут, их суммы меняются вместе с ними.
+            state = self.filter_queryset(Recipe.objects.all()).aggregate(
+                updated_at=Max('updated_at'),
+                views_count=Sum('views_count'),
+                short_link_count=Sum('short_link_count'),
+            )
+            state = ':'.join(
+                (*map(str, state.values()), get_version(RECIPES_VERSION_KEY))
+            )
+            if request.query_params.get('ordering'):
+                state += f':{get_version(RECIPE_SCORES_VERSION_KEY)}'
+        else:
+            try:
+                recipe = (
+                    Recipe.objects.filter(pk=pk)
+                    .values_list(
+                        'updated_at', 'views_count', 'short_link_count'
+                    )
+                    .first()
+                )
+            except ValueError:
+                recipe = None
+            if recipe is None:
+                return None, None
+            # Счётчики входят в ответ и меняются без изменения рецепта.
+            state = ':'.join(
+                (pk, *map(str, recipe), get_version(recipe_version_key(pk)))
+            )
+        versions = ':'.join(
+            get_version(key)
+            for key in (
+                user_flags_version_key(request.user.id),
+                USERS_VERSION_KEY,
+                TAGS_VERSION_KEY,
+                INGREDIENTS_VERSION_KEY,
+            )
+        )
+        return f'{state}:{request.user.id}:{versions}', None
+
     @staticmethod
     def add_or_delete_favorite_or_cart(request, model, pk=None):
         recipe = get_object_or_404(Recipe, pk=pk)
@@ -120,21 +330,118 @@ class RecipeViewSet(viewsets.ModelViewSet):
         detail=False,
         permission_classes=(permissions.IsAuthenticated,),
     )
-    def download_shopping_cart(self, request):
-        """Скачивание файла со списком и количеством продуктов."""
-        recipes_in_shopping_cart = request.user.carts.all()
-        shopping_cart_ingredients = (
-            Ingredient.objects.filter(recipes__carts__user=request.user)
-            .values("name", "measurement_unit")
-            .annotate(amount=Sum("amount_ingredients__amount"))
+    def feed(self, request):
+        """Рецепты авторов, на которых подписан пользователь,
+        сначала новые."""
+        paginator = KeysetCursorPagination()
+        keys = paginator.paginate_keys(
+            lambda limit, position: get_feed(request.user, limit, position),
+            request,
+        )
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for _, recipe_id in keys]
         )
+        page = [
+            recipes[recipe_id] for _, recipe_id in keys if recipe_id in recipes
+        ]
+        return paginator.get_paginated_response(
+            self.get_serializer(page, many=True).data
+        )
+
+    @action(methods=('GET',), detail=False, url_path='what_to_cook')
+    def what_to_cook(self, request):
+        """Рецепты из продуктов, которые есть у пользователя:
+        сначала с наибольшей долей имеющихся продуктов."""
+        try:
+            ingredient_ids = {
+                int(ingredient_id)
+                for value in request.query_params.getlist('ingredients')
+                for ingredient_id in value.split(',')
+                if ingredient_id
+            }
+        except ValueError:
+            raise serializers.ValidationError(
+                {'ingredients': 'Ожидаются id продуктов через запятую.'}
+            )
+        paginator = RecipesLimitPagination()
+        page = paginator.paginate_queryset(
+            recipe_ingredient_index.find(ingredient_ids), request, view=self
+        )
+        recipes = Recipe.objects.in_bulk(
+            [recipe_id for recipe_id, _, _ in page]
+        )
+        context = self.get_serializer_context()
+        return paginator.get_paginated_response(
+            [
+                {
+                    **ShortRecipeSerializer(
+                        recipes[recipe_id], context=context
+                    ).data,
+                    'coverage': round(matched / total, 3),
+                    'missing_ingredients': total - matched,
+                }
+                for recipe_id, matched, total in page
+                if recipe_id in recipes
+            ]
+        )
+
+    @action(
+        methods=('GET',),
+        detail=False,
+        permission_classes=(permissions.IsAuthenticated,),
+        renderer_classes=SHOPPING_LIST_RENDERERS,
+    )
+    def download_shopping_cart(self, request):
+        """Скачивание файла со списком и количеством продуктов.
+        Формат выбирается параметром format или заголовком Accept.
+        С параметром async=true файл формируется в фоне."""
+        renderer = request.accepted_renderer
+        if request.query_params.get('async') in ('1', 'true'):
+            job = ShoppingListJob.objects.create(
+                user=request.user, format=renderer.format
+            )
+            # Ответ в JSON, какой бы формат файла ни был запрошен.
+            return JsonResponse(
+                ShoppingListJobSerializer(
+                    job, context=self.get_serializer_context()
+                ).data,
+                status=status.HTTP_202_ACCEPTED,
+            )
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
         return FileResponse(
-            create_pdf_shopping_list(
-                recipes_in_shopping_cart, shopping_cart_ingredients
-            ),
-            filename='shopping_list.pdf',
+            io.BytesIO(get_shopping_list_document(request.user, renderer)),
+            filename=f'shopping_list.{renderer.format}',
+            content_type=content_type,
+        )
+
+    @action(
+        methods=('GET',),
+        detail=False,
+        url_path=(
+            r'download_shopping_cart/'
+            r'(?P<job_id>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-'
+            r'[0-9a-f]{4}-[0-9a-f]{12})'
+        ),
+        permission_classes=(permissions.IsAuthenticated,),
+    )
+    def shopping_cart_job(self, request, job_id=None):
+        """Статус фонового формирования списка покупок."""
+        job = get_object_or_404(ShoppingListJob, pk=job_id, user=request.user)
+        return Response(
+            ShoppingListJobSerializer(
+                job, context=self.get_serializer_context()
+            ).data
         )
 
+    def handle_exception(self, exc):
+        if self.action == 'download_shopping_cart':
+            # Ошибки отдаются в JSON, а не в формате файла.
+            self.request.accepted_renderer = JSONRenderer()
+            self.request.accepted_media_type = JSONRenderer.media_type
+        return super().handle_exception(exc)
+
 
 class UserViewSet(DjoserUserViewSet):
     '''Эндпоинт юзера. Позволяющий получить информацию
@@ -148,6 +455,66 @@ class UserViewSet(DjoserUserViewSet):
             return (permissions.IsAuthenticated(),)
         return super().get_permissions()
 
+    @staticmethod
+    def get_recipes_limit(request):
+        recipes_limit = request.query_params.get(
+            'recipes_limit', settings.MAX_RECIPES_LIMIT
+        )
+        try:
+            recipes_limit = int(recipes_limit)
+        except (TypeError, ValueError):
+            raise serializers.ValidationError(
+                {'recipes_limit': 'Должно быть целым числом.'}
+            )
+        if recipes_limit < 0:
+            raise serializers.ValidationError(
+                {'recipes_limit': 'Не может быть меньше 0.'}
+            )
+        return min(recipes_limit, settings.MAX_RECIPES_LIMIT)
+
+    @staticmethod
+    def get_subscriptions_queryset(user):
+        """Авторы, на которых подписан пользователь."""
+        return (
+            User.objects.filter(authors__user=user)
+            .annotate(is_subscribed=Value(True, output_field=BooleanField()))
+            .order_by(*User._meta.ordering)
+        )
+
+    @staticmethod
+    def get_limited_recipes(author_ids, recipes_limit):
+        """Не более recipes_limit рецептов каждого автора.
+        Номера рецептов внутри автора считает ROW_NUMBER, поэтому
+        рецепты автора просматриваются один раз,
+        а не коррелированным подзапросом на каждую строку."""
+        quote = connection.ops.quote_name
+        ranked = (
+            f'SELECT {quote("id")} FROM ('
+            f'SELECT {quote("id")}, ROW_NUMBER() OVER ('
+            f'PARTITION BY {quote("author_id")} '
+            f'ORDER BY {quote("name")}, {quote("id")}) AS row_number '
+            f'FROM {quote(Recipe._meta.db_table)} '
+            f'WHERE {quote("author_id")} IN '
+            f'({", ".join(["%s"] * len(author_ids))})'
+            f') ranked WHERE row_number <= %s'
+        )
+        return Recipe.objects.filter(
+            pk__in=RawSQL(ranked, (*author_ids, recipes_limit))
+        ).order_by('author_id', 'name', 'id')
+
+    def prefetch_limited_recipes(self, authors, recipes_limit):
+        """Загружает рецепты авторов страницы одним запросом."""
+        authors = list(authors)
+        recipes = {author.pk: [] for author in authors}
+        if recipes and recipes_limit:
+            for recipe in self.get_limited_recipes(
+                list(recipes), recipes_limit
+            ):
+                recipes[recipe.author_id].append(recipe)
+        for author in authors:
+            author.limited_recipes = recipes[author.pk]
+        return authors
+
     @action(
         detail=False,
         methods=('GET',),
@@ -155,12 +522,22 @@ class UserViewSet(DjoserUserViewSet):
         permission_classes=(permissions.IsAuthenticated,),
     )
     def subscriptions(self, request):
-        paginator = RecipesLimitPagination()
-        page = paginator.paginate_queryset(
-            User.objects.filter(authors__user=request.user), request
+        recipes_limit = self.get_recipes_limit(request)
+        if is_cursor_pagination(request):
+            paginator = SubscriptionsCursorPagination()
+        else:
+            paginator = RecipesLimitPagination()
+        page = self.prefetch_limited_recipes(
+            paginator.paginate_queryset(
+                self.get_subscriptions_queryset(request.user), request
+            ),
+            recipes_limit,
+        )
+        serializer = self.serializer_class(
+            page,
+            many=True,
+            context={'request': request, 'recipes_limit': recipes_limit},
         )
-        serializer = self.serializer_class(page, many=True)
-        serializer.context['request'] = self.request
         return paginator.get_paginated_response(serializer.data)
 
     @action(
@@ -185,8 +562,15 @@ class UserViewSet(DjoserUserViewSet):
                 raise serializers.ValidationError(
                     {'errors': 'Запись уже существует.'}
                 )
-            serializer = self.serializer_class(author)
-            serializer.context['request'] = self.request
+            recipes_limit = self.get_recipes_limit(request)
+            (author,) = self.prefetch_limited_recipes(
+                self.get_subscriptions_queryset(user).filter(pk=author.pk),
+                recipes_limit,
+            )
+            serializer = self.serializer_class(
+                author,
+                context={'request': request, 'recipes_limit': recipes_limit},
+            )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         get_object_or_404(Subscription, author=author, user=user).delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -211,6 +595,9 @@ class UserViewSet(DjoserUserViewSet):
             )
 
         if request.method == 'DELETE' and user.avatar:
-            user.avatar.delete()
+            # Файл может использоваться другими записями,
+            # неиспользуемые файлы удаляет команда collect_media.
+            user.avatar = None
+            user.save(update_fields=('avatar',))
             return Response(status=status.HTTP_204_NO_CONTENT)
         raise serializers.ValidationError('')
@@ -1,4 +1,6 @@
 import os
+import sys
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -39,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -91,6 +94,30 @@ else:
         }
     }
 
+# Версии данных в кэше должны быть общими для всех процессов:
+# воркеров gunicorn и команд manage.py. По умолчанию кэш в файлах
+# общий для процессов одного хоста, в docker используется memcached.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache',
+        ),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram_cache'),
+        ),
+    }
+}
+# Тесты не должны видеть и менять кэш сервера разработки.
+TESTING = sys.argv[1:2] == ['test']
+if TESTING:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -135,6 +162,8 @@ MEDIA_URL = '/media/'
 DEFAULT_MEDIA_ROOT = BASE_DIR / 'media/'
 MEDIA_ROOT = os.getenv('MEDIA_ROOT', DEFAULT_MEDIA_ROOT)
 
+DEFAULT_FILE_STORAGE = 'recipes.storage.ContentAddressedStorage'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -176,4 +205,27 @@ DJOSER = {
 
 MIN_VALUE_COOKING_TIME = 1
 MIN_VALUE_AMOUNT = 1
+MAX_RECIPES_LIMIT = 100
+INGREDIENTS_SEARCH_LIMIT = 50
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60
+RECIPE_DETAIL_CACHE_TIMEOUT = 60 * 60
+SHOPPING_LIST_JOB_TTL = 60 * 60
+MAX_IMAGE_SIZE = 10 * 1024 * 1024
+MAX_IMAGE_DIMENSION = 6000
+IMAGE_VARIANTS = {
+    'thumbnail': (160, 160),
+    'card': (480, 480),
+    'full': (1280, 1280),
+}
+IMAGE_WORKERS = 2
+# Рецепты авторов с большим числом подписчиков не раскладываются
+# по лентам, а выбираются при чтении ленты.
+TIMELINE_FANOUT_LIMIT = 1000
+TIMELINE_BATCH_SIZE = 1000
+TIMELINE_BACKFILL_SIZE = 100
+# За это время вклад добавления в избранное или корзину
+# в trending уменьшается вдвое.
+TRENDING_HALF_LIFE = 24 * 60 * 60
+COUNTERS_FLUSH_INTERVAL = 10
+PERFORMANCE_METRICS = os.getenv('PERFORMANCE_METRICS', 'False') == 'True'
 INVALID_USERNAME = 'me'
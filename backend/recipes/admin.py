@@ -2,40 +2,57 @@ from django.contrib import admin
 from django.contrib.admin.decorators import display
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import Group
-from django.db.models import Sum
+from django.db.models import Prefetch
 from django.utils.safestring import mark_safe
 
+from .counters import ingredient_deltas, update_ingredient_counters
 from .models import (AmountReceptIngredients, Favorite, Ingredient, Recipe,
                      ShoppingCart, Subscription, Tag, User)
 
 
-@admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+def amounts(recipe):
+    return dict(
+        recipe.amount_ingredients.values_list('ingredient_id', 'amount')
+    )
+
+
+class RecipeUserAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'recipe')
-    list_filter = ('user', 'recipe')
-    search_fields = ('user', 'recipe')
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__email', 'user__username', 'recipe__name')
+    autocomplete_fields = ('user', 'recipe')
+    show_full_result_count = False
+
+
+@admin.register(Favorite)
+class FavoriteAdmin(RecipeUserAdmin):
+    pass
 
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'recipe')
-    list_filter = ('user', 'recipe')
-    search_fields = ('user', 'recipe')
+class ShoppingCartAdmin(RecipeUserAdmin):
+    pass
+
+
+@admin.register(Subscription)
+class SubscriptionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'author')
+    list_select_related = ('user', 'author')
+    search_fields = ('user__email', 'user__username', 'author__username')
+    autocomplete_fields = ('user', 'author')
+    show_full_result_count = False
 
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'slug', 'number_of_recipes')
+    list_display = ('id', 'name', 'slug', 'recipes_count')
     search_fields = ('name', 'slug')
 
-    @display(description='Рецепты')
-    def number_of_recipes(self, tag):
-        return tag.recipes.count()
-
 
 class RecipeInline(admin.StackedInline):
     model = AmountReceptIngredients
     extra = 0
+    autocomplete_fields = ('ingredient',)
 
 
 @admin.register(Recipe)
@@ -44,13 +61,18 @@ class RecipeAdmin(admin.ModelAdmin):
     list_display = (
         'name',
         'author',
-        'favorites',
+        'favorites_count',
+        'views_count',
+        'short_link_count',
         'cooking_time',
         'get_ingredients',
         'get_tags',
         'get_html_image',
     )
-    list_filter = ('tags', 'author')
+    list_filter = ('tags',)
+    list_select_related = ('author',)
+    autocomplete_fields = ('author', 'tags')
+    show_full_result_count = False
     search_fields = (
         'name',
         'author__first_name',
@@ -59,6 +81,31 @@ class RecipeAdmin(admin.ModelAdmin):
         'tags__name',
     )
 
+    def get_queryset(self, request):
+        return (
+            super()
+            .get_queryset(request)
+            .prefetch_related(
+                'tags',
+                Prefetch(
+                    'amount_ingredients',
+                    queryset=AmountReceptIngredients.objects.select_related(
+                        'ingredient'
+                    ),
+                ),
+            )
+        )
+
+    def save_related(self, request, form, formsets, change):
+        old = amounts(form.instance)
+        super().save_related(request, form, formsets, change)
+        update_ingredient_counters(
+            ingredient_deltas(old, amounts(form.instance))
+        )
+        # Продукты сохраняются после рецепта, время изменения
+        # рецепта должно учитывать и их.
+        form.instance.save()
+
     @display(description='Картинка')
     @mark_safe
     def get_html_image(self, recipe):
@@ -80,31 +127,18 @@ class RecipeAdmin(admin.ModelAdmin):
             ]
         )
 
-    @display(description='Избранное')
-    def favorites(self, recipe):
-        return recipe.favorites.count()
-
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
     list_display = (
         'name',
-        'amount',
+        'amount_total',
         'measurement_unit',
-        'recipe',
+        'recipes_count',
     )
     search_fields = ('name', 'measurement_unit')
-    list_filter = ('recipes__name', 'measurement_unit')
-
-    @display(description='Количество')
-    def amount(self, ingredient):
-        return ingredient.amount_ingredients.aggregate(sum=Sum('amount')).get(
-            'sum'
-        )
-
-    @display(description='Рецепты')
-    def recipe(self, ingredient):
-        return ingredient.recipes.count()
+    list_filter = ('measurement_unit',)
+    show_full_result_count = False
 
 
 @admin.register(User)
@@ -113,29 +147,11 @@ class UserAdmin(UserAdmin):
 
     list_display = (
         *UserAdmin.list_display,
-        'count_recipes',
-        'count_subscribers',
-        'count_author',
-    )
-    list_filter = (
-        *UserAdmin.list_filter,
-        'recipes__name',
-        'subscribers__user',
-        'authors__author',
+        'recipes_count',
+        'subscriptions_count',
+        'subscribers_count',
     )
-
-    @display(description='Рецептов')
-    def count_recipes(self, user):
-        return user.recipes.count()
-
-    @display(description='Подписок')
-    def count_subscribers(self, user):
-        return user.subscribers.count()
-
-    @display(description='Подписчиков')
-    def count_author(self, user):
-        return user.authors.count()
+    show_full_result_count = False
 
 
-admin.site.register((Subscription,))
 admin.site.unregister(Group)
@@ -0,0 +1,164 @@
+import atexit
+import logging
+import os
+from collections import Counter, defaultdict
+from threading import Lock, Thread
+from time import sleep
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import (Case, Count, F, IntegerField, OuterRef, Subquery,
+                              Sum, Value, When)
+from django.db.models.functions import Coalesce
+
+from recipes.models import (AmountReceptIngredients, Favorite, Ingredient,
+                            Recipe, Subscription, Tag, User)
+
+logger = logging.getLogger(__name__)
+
+
+def increment(queryset, **counters):
+    """Изменяет счётчики записей queryset на указанные величины."""
+    queryset.update(
+        **{name: F(name) + delta for name, delta in counters.items()}
+    )
+
+
+def ingredient_deltas(old, new):
+    """Изменения счётчиков продуктов по словарям
+    {id продукта: количество} до и после изменения рецепта."""
+    deltas = {}
+    for ingredient_id in old.keys() | new.keys():
+        count = (ingredient_id in new) - (ingredient_id in old)
+        amount = new.get(ingredient_id, 0) - old.get(ingredient_id, 0)
+        if count or amount:
+            deltas[ingredient_id] = (count, amount)
+    return deltas
+
+
+def update_ingredient_counters(deltas):
+    """Применяет изменения из ingredient_deltas одним запросом."""
+    if not deltas:
+        return
+
+    def by_ingredient(index):
+        return Case(
+            *(
+                When(pk=ingredient_id, then=Value(delta[index]))
+                for ingredient_id, delta in deltas.items()
+            ),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+
+    Ingredient.objects.filter(pk__in=deltas).update(
+        recipes_count=F('recipes_count') + by_ingredient(0),
+        amount_total=F('amount_total') + by_ingredient(1),
+    )
+
+
+def aggregate_by(model, field, aggregate):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(value=aggregate)
+            .values('value')
+        ),
+        0,
+        output_field=IntegerField(),
+    )
+
+
+def recount():
+    """Пересчитывает все счётчики по связанным таблицам."""
+
+    Recipe.objects.update(
+        favorites_count=aggregate_by(Favorite, 'recipe', Count('pk'))
+    )
+    User.objects.update(
+        recipes_count=aggregate_by(Recipe, 'author', Count('pk')),
+        subscriptions_count=aggregate_by(Subscription, 'user', Count('pk')),
+        subscribers_count=aggregate_by(Subscription, 'author', Count('pk')),
+    )
+    Tag.objects.update(
+        recipes_count=aggregate_by(Recipe.tags.through, 'tag', Count('pk'))
+    )
+    Ingredient.objects.update(
+        recipes_count=aggregate_by(
+            AmountReceptIngredients, 'ingredient', Count('pk')
+        ),
+        amount_total=aggregate_by(
+            AmountReceptIngredients, 'ingredient', Sum('amount')
+        ),
+    )
+
+
+class BufferedCounter:
+    """Приращения счётчика копятся в памяти процесса и записываются
+    фоновым потоком раз в COUNTERS_FLUSH_INTERVAL секунд и при выходе,
+    одним UPDATE на каждую величину приращения."""
+
+    def __init__(self, model, field):
+        self.model = model
+        self.field = field
+        self._lock = Lock()
+        self._pending = Counter()
+        self._pid = None
+
+    def add(self, pk, delta=1):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Первый вызов в этом процессе, в том числе после fork.
+                self._pid = os.getpid()
+                self._pending = Counter()
+                Thread(
+                    target=self._run,
+                    name=f'{self.field}-flush',
+                    daemon=True,
+                ).start()
+            self._pending[pk] += delta
+
+    def _run(self):
+        while True:
+            sleep(settings.COUNTERS_FLUSH_INTERVAL)
+            try:
+                self.try_flush()
+            finally:
+                connection.close()
+
+    def flush(self):
+        """Записывает накопленные приращения в одной транзакции.
+        При ошибке все они возвращаются в очередь."""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        if not pending:
+            return
+        by_delta = defaultdict(list)
+        for pk, delta in pending.items():
+            by_delta[delta].append(pk)
+        try:
+            with transaction.atomic():
+                for delta, pks in by_delta.items():
+                    self.model.objects.filter(pk__in=pks).update(
+                        **{self.field: F(self.field) + delta}
+                    )
+        except Exception:
+            with self._lock:
+                self._pending.update(pending)
+            raise
+
+    def try_flush(self):
+        """flush для фонового потока и выхода из процесса:
+        ошибка записывается в лог, приращения ждут следующей попытки."""
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Не удалось записать счётчик %s', self.field)
+
+
+recipe_views = BufferedCounter(Recipe, 'views_count')
+short_link_hits = BufferedCounter(Recipe, 'short_link_count')
+atexit.register(recipe_views.try_flush)
+atexit.register(short_link_hits.try_flush)
@@ -0,0 +1,53 @@
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.utils import timezone
+from PIL import Image
+
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_WORKERS, thread_name_prefix='recipe-images'
+)
+
+
+def make_image_variants(recipe_id, name):
+    """Уменьшенные копии картинки рецепта в WebP.
+    Сохраняются, только если картинка рецепта за это время не сменилась."""
+    try:
+        variants = {'source': name}
+        root = os.path.splitext(name)[0]
+        with default_storage.open(name) as file, Image.open(file) as image:
+            image = image.convert(
+                'RGBA' if 'A' in image.getbands() else 'RGB'
+            )
+            for variant, size in settings.IMAGE_VARIANTS.items():
+                copy = image.copy()
+                copy.thumbnail(size)
+                buf = io.BytesIO()
+                copy.save(buf, 'WEBP', quality=80)
+                variants[variant] = default_storage.save(
+                    f'{root}_{variant}.webp', ContentFile(buf.getvalue())
+                )
+        Recipe.objects.filter(pk=recipe_id, image=name).update(
+            image_variants=variants, updated_at=timezone.now()
+        )
+    except Exception:
+        logger.exception('Не удалось уменьшить картинку %s', name)
+    finally:
+        connection.close()
+
+
+def schedule_image_variants(recipe):
+    """Копии формируются в фоновом потоке, если ещё не готовы."""
+    if recipe.image and recipe.image_variants.get('source') != (
+        recipe.image.name
+    ):
+        executor.submit(make_image_variants, recipe.pk, recipe.image.name)
@@ -0,0 +1,77 @@
+import posixpath
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.models import Recipe, ShoppingListJob, User
+
+MEDIA_DIRECTORIES = ('recipe/images', 'users', 'shopping_lists')
+
+
+class Command(BaseCommand):
+    help = 'Удаление файлов, на которые не ссылается ни одна запись.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать файлы, которые будут удалены.',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=60 * 60,
+            help=(
+                'Не трогать файлы моложе указанного числа секунд, '
+                'они могут быть ещё не сохранены в записи.'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        referenced = self.get_referenced_files()
+        created_before = timezone.now() - timedelta(
+            seconds=options['min_age']
+        )
+        deleted = 0
+        for directory in MEDIA_DIRECTORIES:
+            if not default_storage.exists(directory):
+                continue
+            for file_name in default_storage.listdir(directory)[1]:
+                name = posixpath.join(directory, file_name)
+                if (
+                    name in referenced
+                    or default_storage.get_modified_time(name)
+                    > created_before
+                ):
+                    continue
+                if not options['dry_run']:
+                    default_storage.delete(name)
+                self.stdout.write(name)
+                deleted += 1
+        self.stdout.write(
+            self.style.SUCCESS(f'Удалено файлов: {deleted}')
+        )
+
+    @staticmethod
+    def get_referenced_files():
+        referenced = set(
+            Recipe.objects.values_list('image', flat=True).iterator()
+        )
+        for variants in Recipe.objects.values_list(
+            'image_variants', flat=True
+        ).iterator():
+            referenced.update(variants.values())
+        referenced.update(
+            User.objects.exclude(avatar__isnull=True)
+            .exclude(avatar='')
+            .values_list('avatar', flat=True)
+            .iterator()
+        )
+        referenced.update(
+            ShoppingListJob.objects.exclude(file='')
+            .values_list('file', flat=True)
+            .iterator()
+        )
+        return referenced
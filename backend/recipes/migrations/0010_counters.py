@@ -0,0 +1,99 @@
+# Generated by Django 3.2.3 on 2026-10-18 04:43
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def aggregate_by(model, field, aggregate):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(value=aggregate)
+            .values('value')
+        ),
+        0,
+        output_field=IntegerField(),
+    )
+
+
+def recount_all(apps, schema_editor):
+    """Копия recipes.counters.recount на момент миграции,
+    чтобы её изменения не ломали применение миграций с нуля."""
+    User = apps.get_model('recipes', 'User')
+    Tag = apps.get_model('recipes', 'Tag')
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    AmountReceptIngredients = apps.get_model(
+        'recipes', 'AmountReceptIngredients'
+    )
+    Favorite = apps.get_model('recipes', 'Favorite')
+    Subscription = apps.get_model('recipes', 'Subscription')
+
+    Recipe.objects.update(
+        favorites_count=aggregate_by(Favorite, 'recipe', Count('pk'))
+    )
+    User.objects.update(
+        recipes_count=aggregate_by(Recipe, 'author', Count('pk')),
+        subscriptions_count=aggregate_by(Subscription, 'user', Count('pk')),
+        subscribers_count=aggregate_by(Subscription, 'author', Count('pk')),
+    )
+    Tag.objects.update(
+        recipes_count=aggregate_by(Recipe.tags.through, 'tag', Count('pk'))
+    )
+    Ingredient.objects.update(
+        recipes_count=aggregate_by(
+            AmountReceptIngredients, 'ingredient', Count('pk')
+        ),
+        amount_total=aggregate_by(
+            AmountReceptIngredients, 'ingredient', Sum('amount')
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='amount_total',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Количество'),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipes_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Рецептов'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='recipes_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Рецептов'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Рецептов'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='subscribers_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='subscriptions_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Подписок'),
+        ),
+        migrations.RunPython(recount_all, migrations.RunPython.noop),
+    ]
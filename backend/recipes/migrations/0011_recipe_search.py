@@ -0,0 +1,93 @@
+from collections import defaultdict
+
+from django.db import migrations
+
+SEARCH_TABLE = 'recipes_recipe_search'
+SEARCH_CONFIG = 'russian'
+BATCH_SIZE = 1000
+
+
+def normalize(text):
+    return text.lower().replace('ё', 'е')
+
+
+def get_documents(Recipe, AmountReceptIngredients, ids):
+    ingredients = defaultdict(list)
+    for recipe_id, name in AmountReceptIngredients.objects.filter(
+        recipe_id__in=ids
+    ).values_list('recipe_id', 'ingredient__name'):
+        ingredients[recipe_id].append(name)
+    return [
+        (
+            recipe_id,
+            normalize(name),
+            normalize(text),
+            normalize(' '.join(ingredients[recipe_id])),
+        )
+        for recipe_id, name, text in Recipe.objects.filter(
+            pk__in=ids
+        ).values_list('id', 'name', 'text')
+    ]
+
+
+def create_search_index(apps, schema_editor):
+    """Копия recipes.search на момент миграции: таблица tsvector с GIN
+    в PostgreSQL, FTS5 в SQLite, для других БД индекс не создаётся."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE TABLE {SEARCH_TABLE} '
+            '(recipe_id integer PRIMARY KEY, document tsvector NOT NULL)'
+        )
+        schema_editor.execute(
+            f'CREATE INDEX {SEARCH_TABLE}_document_idx '
+            f'ON {SEARCH_TABLE} USING GIN (document)'
+        )
+        insert = (
+            f'INSERT INTO {SEARCH_TABLE} (recipe_id, document) '
+            f"SELECT %s, setweight(to_tsvector('{SEARCH_CONFIG}', %s), 'A') "
+            f"|| setweight(to_tsvector('{SEARCH_CONFIG}', %s), 'C') "
+            f"|| setweight(to_tsvector('{SEARCH_CONFIG}', %s), 'B')"
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5'
+            "(name, text, ingredients, tokenize='unicode61')"
+        )
+        insert = (
+            f'INSERT INTO {SEARCH_TABLE} '
+            '(rowid, name, text, ingredients) VALUES (%s, %s, %s, %s)'
+        )
+    else:
+        return
+    Recipe = apps.get_model('recipes', 'Recipe')
+    AmountReceptIngredients = apps.get_model(
+        'recipes', 'AmountReceptIngredients'
+    )
+    ids = list(Recipe.objects.order_by('pk').values_list('pk', flat=True))
+    with schema_editor.connection.cursor() as cursor:
+        for start in range(0, len(ids), BATCH_SIZE):
+            cursor.executemany(
+                insert,
+                get_documents(
+                    Recipe,
+                    AmountReceptIngredients,
+                    ids[start:start + BATCH_SIZE],
+                ),
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 3.2.3 on 2026-10-18 04:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_by_recipe(model):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(recipe=OuterRef('pk'))
+            .order_by()
+            .values('recipe')
+            .annotate(value=Count('pk'))
+            .values('value')
+        ),
+        0,
+        output_field=IntegerField(),
+    )
+
+
+def create_scores(apps, schema_editor):
+    """Копия recipes.scores.refresh_popularity на момент миграции."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeScore = apps.get_model('recipes', 'RecipeScore')
+    RecipeScore.objects.bulk_create(
+        (
+            RecipeScore(recipe_id=recipe_id)
+            for recipe_id in Recipe.objects.values_list('id', flat=True)
+        ),
+        batch_size=1000,
+    )
+    RecipeScore.objects.update(
+        popularity=count_by_recipe(apps.get_model('recipes', 'Favorite'))
+        + count_by_recipe(apps.get_model('recipes', 'ShoppingCart'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeScore',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('popularity', models.IntegerField(default=0, verbose_name='Популярность')),
+                ('trending', models.FloatField(default=0, verbose_name='Набирает популярность')),
+                ('decayed_at', models.DateTimeField(blank=True, null=True, verbose_name='Последнее затухание')),
+            ],
+            options={
+                'verbose_name': 'Популярность рецепта',
+                'verbose_name_plural': 'Популярность рецептов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipescore',
+            index=models.Index(fields=['-popularity', 'recipe'], name='recipe_score_popularity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipescore',
+            index=models.Index(fields=['-trending', 'recipe'], name='recipe_score_trending_idx'),
+        ),
+        migrations.RunPython(create_scores, migrations.RunPython.noop),
+    ]
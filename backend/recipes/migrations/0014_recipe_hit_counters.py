@@ -0,0 +1,23 @@
+# Generated by Django 3.2.3 on 2026-10-18 04:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_recipescore'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='short_link_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Переходов по ссылке'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='views_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Просмотров'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.2.3 on 2026-10-18 05:08
+
+from django.db import migrations, models
+
+
+def create_missing_scores(apps, schema_editor):
+    """Записи популярности рецептов, которые ещё не добавлялись
+    в избранное или корзину."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeScore = apps.get_model('recipes', 'RecipeScore')
+    RecipeScore.objects.bulk_create(
+        (
+            RecipeScore(recipe_id=recipe_id)
+            for recipe_id in Recipe.objects.filter(
+                score__isnull=True
+            ).values_list('id', flat=True)
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_recipe_pub_date_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='recipescore',
+            name='recipe_score_popularity_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='recipescore',
+            name='recipe_score_trending_idx',
+        ),
+        migrations.AddIndex(
+            model_name='recipescore',
+            index=models.Index(fields=['-popularity', '-recipe'], name='recipe_score_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipescore',
+            index=models.Index(fields=['-trending', '-recipe'], name='recipe_score_trend_idx'),
+        ),
+        migrations.RunPython(
+            create_missing_scores, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery
+
+
+def make_pub_dates_distinct(apps, schema_editor):
+    """Рецептам, получившим при добавлении поля одинаковое время
+    публикации, назначается время в порядке id: последний рецепт
+    группы сохраняет своё время, предыдущие - на микросекунду раньше."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    TimelineEntry = apps.get_model('recipes', 'TimelineEntry')
+    duplicates = (
+        Recipe.objects.values('pub_date')
+        .annotate(recipes=Count('id'))
+        .filter(recipes__gt=1)
+        .order_by()
+        .values_list('pub_date', flat=True)
+    )
+    for pub_date in list(duplicates):
+        recipes = list(
+            Recipe.objects.filter(pub_date=pub_date).order_by('-id').only(
+                'pub_date'
+            )
+        )
+        for number, recipe in enumerate(recipes):
+            recipe.pub_date = pub_date - timedelta(microseconds=number)
+        Recipe.objects.bulk_update(recipes, ('pub_date',), batch_size=1000)
+        TimelineEntry.objects.filter(recipe__pub_date__lt=pub_date).filter(
+            pub_date=pub_date
+        ).update(
+            pub_date=Subquery(
+                Recipe.objects.filter(pk=OuterRef('recipe')).values(
+                    'pub_date'
+                )
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_recipe_score_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            make_pub_dates_distinct, migrations.RunPython.noop
+        ),
+    ]
@@ -1,3 +1,5 @@
+from uuid import uuid4
+
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator
@@ -7,7 +9,28 @@ from django.db.models import CheckConstraint, F, Q, UniqueConstraint
 from .validators import validate_username
 
 
-class User(AbstractUser):
+class CountersMixin:
+    """Счётчики меняются только F-выражениями, поэтому save()
+    существующей записи их не перезаписывает."""
+
+    counters = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            not self._state.adding
+            and not args
+            and kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert')
+        ):
+            kwargs['update_fields'] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.counters
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(CountersMixin, AbstractUser):
     avatar = models.ImageField(
         blank=True, null=True, upload_to='users/', verbose_name='Аватар'
     )
@@ -22,6 +45,17 @@ class User(AbstractUser):
         verbose_name='Псевдоним пользователя',
         validators=[validate_username],
     )
+    recipes_count = models.IntegerField(
+        default=0, editable=False, verbose_name='Рецептов'
+    )
+    subscriptions_count = models.IntegerField(
+        default=0, editable=False, verbose_name='Подписок'
+    )
+    subscribers_count = models.IntegerField(
+        default=0, editable=False, verbose_name='Подписчиков'
+    )
+
+    counters = ('recipes_count', 'subscriptions_count', 'subscribers_count')
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name')
@@ -32,11 +66,16 @@ class User(AbstractUser):
         ordering = ('username',)
 
 
-class Tag(models.Model):
+class Tag(CountersMixin, models.Model):
     name = models.CharField(max_length=32, verbose_name='Название')
     slug = models.SlugField(
         max_length=32, verbose_name='Идентификатор', unique=True
     )
+    recipes_count = models.IntegerField(
+        default=0, editable=False, verbose_name='Рецептов'
+    )
+
+    counters = ('recipes_count',)
 
     class Meta:
         verbose_name = 'Тег'
@@ -48,7 +87,7 @@ class Tag(models.Model):
         return self.name[:20]
 
 
-class Ingredient(models.Model):
+class Ingredient(CountersMixin, models.Model):
     name = models.CharField(
         max_length=128, verbose_name='Название', unique=True
     )
@@ -56,6 +95,14 @@ class Ingredient(models.Model):
         max_length=64,
         verbose_name='Единица измерения',
     )
+    recipes_count = models.IntegerField(
+        default=0, editable=False, verbose_name='Рецептов'
+    )
+    amount_total = models.IntegerField(
+        default=0, editable=False, verbose_name='Количество'
+    )
+
+    counters = ('recipes_count', 'amount_total')
 
     class Meta:
         verbose_name = 'Продукт'
@@ -67,7 +114,7 @@ class Ingredient(models.Model):
         return f'{self.name} ({self.measurement_unit})'
 
 
-class Recipe(models.Model):
+class Recipe(CountersMixin, models.Model):
     author = models.ForeignKey(
         User, verbose_name='Автор', on_delete=models.CASCADE
     )
@@ -76,6 +123,12 @@ class Recipe(models.Model):
     image = models.ImageField(
         verbose_name='Картинка', upload_to='recipe/images/'
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии картинки',
+    )
     ingredients = models.ManyToManyField(
         Ingredient,
         through='AmountReceptIngredients',
@@ -88,12 +141,40 @@ class Recipe(models.Model):
         ],
         verbose_name='Время приготовления в минутах',
     )
+    pub_date = models.DateTimeField(
+        auto_now_add=True, verbose_name='Опубликован'
+    )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Изменён')
+    favorites_count = models.IntegerField(
+        default=0, editable=False, verbose_name='В избранном'
+    )
+    views_count = models.IntegerField(
+        default=0, editable=False, verbose_name='Просмотров'
+    )
+    short_link_count = models.IntegerField(
+        default=0, editable=False, verbose_name='Переходов по ссылке'
+    )
+
+    counters = ('favorites_count', 'views_count', 'short_link_count')
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('name',)
         default_related_name = 'recipes'
+        indexes = [
+            models.Index(fields=('name',), name='recipe_name_idx'),
+            models.Index(
+                fields=('author', 'name'), name='recipe_author_name_idx'
+            ),
+            models.Index(
+                fields=('-pub_date', '-id'), name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_pub_date_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name[:20]
@@ -151,6 +232,11 @@ class BaseRecipeUser(models.Model):
                 name='%recipes_unique',
             )
         ]
+        indexes = [
+            models.Index(
+                fields=('recipe', 'user'), name='%(class)s_recipe_user_idx'
+            ),
+        ]
 
     def __str__(self):
         return (
@@ -202,6 +288,133 @@ class Subscription(models.Model):
                 check=~Q(author=F('user')), name='no_self_sibscription'
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=('author', 'user'), name='subscription_author_user_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.user.email[:20]} подписан на {self.author.email[:20]}'
+
+
+class RecipeScore(models.Model):
+    """Популярность рецепта для сортировки списка, создаётся вместе
+    с рецептом. trending со временем уменьшается командой
+    update_recipe_scores."""
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='score',
+        verbose_name='Рецепт',
+    )
+    popularity = models.IntegerField(default=0, verbose_name='Популярность')
+    trending = models.FloatField(
+        default=0, verbose_name='Набирает популярность'
+    )
+    decayed_at = models.DateTimeField(
+        null=True, blank=True, verbose_name='Последнее затухание'
+    )
+
+    class Meta:
+        verbose_name = 'Популярность рецепта'
+        verbose_name_plural = 'Популярность рецептов'
+        indexes = [
+            models.Index(
+                fields=('-popularity', '-recipe'),
+                name='recipe_score_popular_idx',
+            ),
+            models.Index(
+                fields=('-trending', '-recipe'),
+                name='recipe_score_trend_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.popularity}'
+
+
+class TimelineEntry(models.Model):
+    """Рецепт автора в ленте подписчика, записывается при публикации."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор рецепта',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт',
+    )
+    pub_date = models.DateTimeField(verbose_name='Опубликован')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        ordering = ('-pub_date', '-recipe')
+        constraints = [
+            UniqueConstraint(
+                fields=('user', 'recipe'), name='unique_timeline_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='timeline_user_pub_date_idx',
+            ),
+            models.Index(
+                fields=('user', 'author'), name='timeline_user_author_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user.email[:20]}: {self.recipe.name[:20]}'
+
+
+class ShoppingListJob(models.Model):
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (PROCESSING, 'Формируется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, verbose_name='Пользователь'
+    )
+    format = models.CharField(max_length=16, verbose_name='Формат')
+    status = models.CharField(
+        max_length=16,
+        choices=STATUSES,
+        default=PENDING,
+        verbose_name='Статус',
+    )
+    file = models.FileField(
+        blank=True, upload_to='shopping_lists/', verbose_name='Файл'
+    )
+    created = models.DateTimeField(auto_now_add=True, verbose_name='Создано')
+
+    class Meta:
+        verbose_name = 'Формирование списка покупок'
+        verbose_name_plural = 'Формирование списков покупок'
+        ordering = ('created',)
+        default_related_name = 'shopping_list_jobs'
+
+    def __str__(self):
+        return f'{self.user.email[:20]}: {self.format} ({self.status})'
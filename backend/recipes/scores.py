@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.db.models import Count, F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from recipes.counters import aggregate_by
+from recipes.models import Favorite, Recipe, RecipeScore, ShoppingCart
+
+
+def change_score(recipe_id, delta):
+    """Добавление (delta=1) или удаление (delta=-1) рецепта
+    из избранного или корзины."""
+    changes = {
+        'popularity': F('popularity') + delta,
+        'trending': Greatest(F('trending') + delta, Value(0.0)),
+    }
+    scores = RecipeScore.objects.filter(recipe_id=recipe_id)
+    if not scores.update(**changes) and delta > 0:
+        RecipeScore.objects.bulk_create(
+            (RecipeScore(recipe_id=recipe_id),), ignore_conflicts=True
+        )
+        scores.update(**changes)
+
+
+def decay(now=None):
+    """Уменьшает trending пропорционально времени с прошлого затухания.
+    Записи, созданные после него, пока не затухают."""
+    now = now or timezone.now()
+    scores = RecipeScore.objects.exclude(trending=0)
+    for decayed_at in scores.values_list('decayed_at', flat=True).distinct():
+        if decayed_at is not None:
+            factor = 0.5 ** (
+                (now - decayed_at).total_seconds()
+                / settings.TRENDING_HALF_LIFE
+            )
+            scores.filter(decayed_at=decayed_at).update(
+                trending=F('trending') * factor
+            )
+    # Почти нулевые значения обнуляются и больше не пересчитываются.
+    scores.filter(trending__lt=0.001).update(trending=0)
+    RecipeScore.objects.update(decayed_at=now)
+
+
+def refresh_popularity():
+    """Создаёт недостающие записи и пересчитывает popularity
+    по избранному и корзинам."""
+    RecipeScore.objects.bulk_create(
+        (
+            RecipeScore(recipe_id=recipe_id)
+            for recipe_id in Recipe.objects.filter(
+                score__isnull=True
+            ).values_list('id', flat=True)
+        ),
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+    RecipeScore.objects.update(
+        popularity=aggregate_by(Favorite, 'recipe', Count('pk'))
+        + aggregate_by(ShoppingCart, 'recipe', Count('pk'))
+    )
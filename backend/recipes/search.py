@@ -0,0 +1,130 @@
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_TABLE = 'recipes_recipe_search'
+SEARCH_CONFIG = 'russian'
+# Веса названия, описания и продуктов для bm25 в SQLite.
+SQLITE_WEIGHTS = (10.0, 1.0, 4.0)
+
+
+def normalize(text):
+    return text.lower().replace('ё', 'е')
+
+
+def is_supported():
+    return connection.vendor in ('postgresql', 'sqlite')
+
+
+def get_documents(recipes):
+    """(id, название, описание, названия продуктов) рецептов queryset."""
+    ingredients = defaultdict(list)
+    for recipe_id, name in recipes.model.ingredients.through.objects.filter(
+        recipe__in=recipes
+    ).values_list('recipe_id', 'ingredient__name'):
+        ingredients[recipe_id].append(name)
+    return [
+        (recipe_id, name, text, ' '.join(ingredients[recipe_id]))
+        for recipe_id, name, text in recipes.values_list('id', 'name', 'text')
+    ]
+
+
+def index_recipes(recipes):
+    """Добавляет или обновляет рецепты queryset в поисковом индексе."""
+    if not is_supported():
+        return
+    documents = [
+        (recipe_id, *map(normalize, fields))
+        for recipe_id, *fields in get_documents(recipes)
+    ]
+    if not documents:
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} (recipe_id, document) '
+                f"SELECT %s, setweight(to_tsvector('{SEARCH_CONFIG}', %s), "
+                f"'A') || setweight(to_tsvector('{SEARCH_CONFIG}', %s), "
+                f"'C') || setweight(to_tsvector('{SEARCH_CONFIG}', %s), "
+                "'B') ON CONFLICT (recipe_id) "
+                'DO UPDATE SET document = EXCLUDED.document',
+                documents,
+            )
+        else:
+            cursor.executemany(
+                f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s',
+                [(document[0],) for document in documents],
+            )
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} '
+                '(rowid, name, text, ingredients) VALUES (%s, %s, %s, %s)',
+                documents,
+            )
+
+
+def remove_recipes(recipe_ids):
+    if not is_supported() or not recipe_ids:
+        return
+    column = 'recipe_id' if connection.vendor == 'postgresql' else 'rowid'
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {SEARCH_TABLE} WHERE {column} = %s',
+            [(recipe_id,) for recipe_id in recipe_ids],
+        )
+
+
+def match_query(query):
+    """Запрос FTS5: все слова обязательны, последнее ищется по префиксу,
+    кавычки не дают пользователю использовать синтаксис FTS5."""
+    words = [
+        '"{}"'.format(word.replace('"', '""'))
+        for word in normalize(query).split()
+    ]
+    if words:
+        words[-1] += '*'
+    return ' '.join(words)
+
+
+def search(recipes, query):
+    """Рецепты queryset, найденные по названию, описанию и продуктам,
+    с релевантностью search_rank (чем больше, тем лучше)."""
+    if connection.vendor == 'postgresql':
+        query = normalize(query)
+        tsquery = f"plainto_tsquery('{SEARCH_CONFIG}', %s)"
+        return recipes.filter(
+            pk__in=RawSQL(
+                f'SELECT recipe_id FROM {SEARCH_TABLE} '
+                f'WHERE document @@ {tsquery}',
+                (query,),
+            )
+        ).annotate(
+            search_rank=RawSQL(
+                f'SELECT ts_rank(document, {tsquery}) FROM {SEARCH_TABLE} '
+                f'WHERE recipe_id = {recipes.model._meta.db_table}.id',
+                (query,),
+                output_field=FloatField(),
+            )
+        )
+    if connection.vendor == 'sqlite':
+        query = match_query(query)
+        weights = ', '.join(map(str, SQLITE_WEIGHTS))
+        return recipes.filter(
+            pk__in=RawSQL(
+                f'SELECT rowid FROM {SEARCH_TABLE} '
+                f'WHERE {SEARCH_TABLE} MATCH %s',
+                (query,),
+            )
+        ).annotate(
+            search_rank=RawSQL(
+                f'SELECT -bm25({SEARCH_TABLE}, {weights}) '
+                f'FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+                f'AND rowid = {recipes.model._meta.db_table}.id',
+                (query,),
+                output_field=FloatField(),
+            )
+        )
+    return recipes.filter(name__icontains=query).annotate(
+        search_rank=Value(0.0, output_field=FloatField())
+    )
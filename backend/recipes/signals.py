@@ -0,0 +1,131 @@
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from recipes.counters import (increment, ingredient_deltas,
+                              update_ingredient_counters)
+from recipes.images import schedule_image_variants
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeScore,
+                            ShoppingCart, Subscription, Tag, User)
+from recipes.scores import change_score
+from recipes.search import index_recipes, remove_recipes
+from recipes.timeline import backfill, fan_out, prune
+
+
+def recipe_committed(recipe):
+    schedule_image_variants(recipe)
+    index_recipes(Recipe.objects.filter(pk=recipe.pk))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+    if created:
+        increment(User.objects.filter(pk=instance.author_id), recipes_count=1)
+        RecipeScore.objects.create(recipe=instance)
+        transaction.on_commit(lambda: fan_out(instance))
+    # Продукты нового рецепта добавляются после его сохранения,
+    # индекс обновляется, когда они уже записаны.
+    transaction.on_commit(lambda: recipe_committed(instance))
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    increment(User.objects.filter(pk=instance.author_id), recipes_count=-1)
+    increment(Tag.objects.filter(recipes=instance), recipes_count=-1)
+    update_ingredient_counters(
+        ingredient_deltas(
+            dict(
+                instance.amount_ingredients.values_list(
+                    'ingredient_id', 'amount'
+                )
+            ),
+            {},
+        )
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    remove_recipes((instance.pk,))
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(sender, instance, created, **kwargs):
+    if not created:
+        transaction.on_commit(
+            lambda: index_recipes(Recipe.objects.filter(ingredients=instance))
+        )
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        if reverse:
+            Tag.objects.filter(pk=instance.pk).update(recipes_count=0)
+        else:
+            increment(Tag.objects.filter(recipes=instance), recipes_count=-1)
+        return
+    if action not in ('post_add', 'post_remove') or not pk_set:
+        return
+    delta = 1 if action == 'post_add' else -1
+    if reverse:
+        increment(
+            Tag.objects.filter(pk=instance.pk),
+            recipes_count=delta * len(pk_set),
+        )
+    else:
+        increment(Tag.objects.filter(pk__in=pk_set), recipes_count=delta)
+
+
+def change_favorites_count(favorite, delta):
+    increment(
+        Recipe.objects.filter(pk=favorite.recipe_id), favorites_count=delta
+    )
+    change_score(favorite.recipe_id, delta)
+
+
+def change_subscription_counts(subscription, delta):
+    increment(
+        User.objects.filter(pk=subscription.user_id),
+        subscriptions_count=delta,
+    )
+    increment(
+        User.objects.filter(pk=subscription.author_id),
+        subscribers_count=delta,
+    )
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_saved(sender, instance, created, **kwargs):
+    if created:
+        change_favorites_count(instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, instance, **kwargs):
+    change_favorites_count(instance, -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_saved(sender, instance, created, **kwargs):
+    if created:
+        change_score(instance.recipe_id, 1)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def shopping_cart_deleted(sender, instance, **kwargs):
+    change_score(instance.recipe_id, -1)
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_saved(sender, instance, created, **kwargs):
+    if created:
+        change_subscription_counts(instance, 1)
+        backfill(instance.user_id, instance.author)
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_deleted(sender, instance, **kwargs):
+    change_subscription_counts(instance, -1)
+    prune(instance.user_id, instance.author_id)
@@ -0,0 +1,33 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Файлы называются по SHA-256 содержимого: одинаковые файлы
+    хранятся один раз, а повторная запись пропускается.
+    Файл может использоваться несколькими записями, поэтому он удаляется
+    не вместе с записью, а командой collect_media."""
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        extension = posixpath.splitext(name)[1].lower()
+        name = posixpath.join(
+            posixpath.dirname(name), digest.hexdigest() + extension
+        )
+        try:
+            # Время изменения обновляется, чтобы collect_media
+            # не удалил файл, который снова начал использоваться.
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return super().save(name, content, max_length)
+        return name
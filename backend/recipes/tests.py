@@ -0,0 +1,343 @@
+import io
+import os
+import posixpath
+import re
+import tempfile
+import time
+from threading import Event, Thread
+from unittest import mock
+
+from django.conf import settings as django_settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import DatabaseError, connection
+from django.db.models import Exists, OuterRef, QuerySet
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from api.filters import RecipesFilter
+from api.views import UserViewSet
+from recipes.counters import BufferedCounter, recipe_views
+from recipes.images import executor, make_image_variants
+from recipes.models import (AmountReceptIngredients, Favorite, Ingredient,
+                            Recipe, ShoppingCart, Subscription, Tag,
+                            TimelineEntry, User)
+from recipes.storage import ContentAddressedStorage
+
+# Полный просмотр в плане SQLite или PostgreSQL. Просмотр
+# подзапроса SQLite тоже называет SCAN, поэтому имя проверяется отдельно.
+SEQUENTIAL_SCAN = re.compile(r'\bSCAN (\S+)$|Seq Scan on (\S+)', re.M)
+
+
+class QueryPlanTest(TestCase):
+    """Запросы фильтров и сортировок списка рецептов используют индексы."""
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # На пустых таблицах планировщик всегда выбирает Seq Scan.
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def tearDown(self):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('RESET enable_seqscan')
+
+    def assert_uses_indexes(self, queryset):
+        plan = queryset.explain()
+        tables = set(connection.introspection.table_names())
+        for match in SEQUENTIAL_SCAN.finditer(plan):
+            self.assertNotIn(
+                match.group(1) or match.group(2),
+                tables,
+                f'Полный просмотр таблицы:\n{plan}',
+            )
+        return plan
+
+    def test_recipe_list(self):
+        querysets = {
+            'ordering': Recipe.objects.all(),
+            'author': Recipe.objects.filter(author=1),
+            'cursor': Recipe.objects.order_by('-pub_date', '-id'),
+            'cursor_page': Recipe.objects.filter(
+                pub_date__lt=timezone.now()
+            ).order_by('-pub_date', '-id'),
+            'tags': Recipe.objects.filter(
+                Exists(
+                    Recipe.tags.through.objects.filter(
+                        recipe=OuterRef('pk'), tag__slug__in=('breakfast',)
+                    )
+                )
+            ),
+        }
+        for value in ('popular', 'trending'):
+            querysets[value] = RecipesFilter().filter_ordering(
+                Recipe.objects.all(), 'ordering', value
+            )
+        for name, queryset in querysets.items():
+            with self.subTest(name):
+                self.assert_uses_indexes(queryset[:10])
+
+    def test_recipe_relations(self):
+        querysets = {
+            'favorite': Favorite.objects.filter(recipe=1),
+            'shopping_cart': ShoppingCart.objects.filter(recipe=1),
+            'subscribers': Subscription.objects.filter(author=1),
+            'subscriptions': Subscription.objects.filter(user=1),
+            'timeline': TimelineEntry.objects.filter(
+                user=1, pub_date__lt=timezone.now()
+            ).order_by('-pub_date', '-recipe_id')[:10],
+            # Рецепты автора, которые не раскладываются по лентам.
+            'feed_author': Recipe.objects.filter(
+                author=1, pub_date__lt=timezone.now()
+            ).order_by('-pub_date', '-id')[:10],
+        }
+        for name, queryset in querysets.items():
+            with self.subTest(name):
+                plan = self.assert_uses_indexes(queryset)
+                if name in ('timeline', 'feed_author'):
+                    self.assertNotIn('TEMP B-TREE', plan)
+                    self.assertNotIn('Sort', plan)
+
+    def test_subscription_recipes(self):
+        """Подзапрос рецептов подписок не выполняется
+        заново для каждой строки."""
+        plan = self.assert_uses_indexes(
+            UserViewSet.get_limited_recipes([1, 2], 3)
+        )
+        self.assertNotIn('CORRELATED', plan)
+        self.assertNotIn('SubPlan', plan)
+
+
+class ContentAddressedStorageTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.storage = ContentAddressedStorage(location=directory.name)
+
+    def test_same_content_is_stored_once(self):
+        name = self.storage.save('users/a.png', ContentFile(b'image'))
+        self.assertEqual(
+            self.storage.save('users/b.png', ContentFile(b'image')), name
+        )
+        self.assertEqual(
+            self.storage.listdir('users')[1], [posixpath.basename(name)]
+        )
+
+    def test_saving_again_refreshes_modified_time(self):
+        """Старый файл, который снова используется, не удаляется
+        командой collect_media как давно не изменявшийся."""
+        name = self.storage.save('users/a.png', ContentFile(b'image'))
+        os.utime(self.storage.path(name), (0, 0))
+        self.storage.save('users/b.png', ContentFile(b'image'))
+        self.assertGreater(
+            os.path.getmtime(self.storage.path(name)), time.time() - 60
+        )
+
+
+class AdminChangelistTest(TestCase):
+    """Количество запросов страницы списка в админке
+    не зависит от количества записей."""
+
+    CHANGELISTS = (
+        'recipe',
+        'favorite',
+        'shoppingcart',
+        'subscription',
+        'tag',
+        'ingredient',
+        'user',
+    )
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            email='admin@example.com',
+            username='admin',
+            password='password',
+            first_name='Админ',
+            last_name='Админ',
+        )
+        self.client.force_login(self.admin)
+        self.tag = Tag.objects.create(name='Тег', slug='tag')
+        self.number = 0
+
+    def add_rows(self, count):
+        for _ in range(count):
+            self.number += 1
+            user = User.objects.create(
+                email=f'user{self.number}@example.com',
+                username=f'user{self.number}',
+            )
+            ingredient = Ingredient.objects.create(
+                name=f'Продукт {self.number}', measurement_unit='г'
+            )
+            recipe = Recipe.objects.create(
+                author=user,
+                name=f'Рецепт {self.number}',
+                text='Описание',
+                image='recipe/images/recipe.png',
+                cooking_time=10,
+            )
+            recipe.tags.add(self.tag)
+            AmountReceptIngredients.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=1
+            )
+            Favorite.objects.create(user=self.admin, recipe=recipe)
+            ShoppingCart.objects.create(user=self.admin, recipe=recipe)
+            Subscription.objects.create(user=self.admin, author=user)
+
+    def get_changelist(self, model):
+        response = self.client.get(f'/admin/recipes/{model}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_changelists(self):
+        self.add_rows(2)
+        queries = {}
+        for model in self.CHANGELISTS:
+            with CaptureQueriesContext(connection) as context:
+                self.get_changelist(model)
+            queries[model] = len(context)
+        self.add_rows(10)
+        for model in self.CHANGELISTS:
+            with self.subTest(model), self.assertNumQueries(queries[model]):
+                self.get_changelist(model)
+
+
+@override_settings(COUNTERS_FLUSH_INTERVAL=60 * 60)
+class BufferedCounterTest(TransactionTestCase):
+    """Приращения записываются в БД ровно один раз. Фоновая запись
+    отключена большим интервалом, flush вызывается тестом."""
+
+    def setUp(self):
+        author = User.objects.create(
+            email='author@example.com', username='author'
+        )
+        # bulk_create не вызывает сигналы рецепта.
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=author,
+                name=f'Рецепт {number}',
+                text='Описание',
+                image='recipe/images/recipe.png',
+                cooking_time=10,
+            )
+            for number in range(3)
+        )
+        self.recipe_ids = [
+            recipe.pk for recipe in Recipe.objects.order_by('pk')
+        ]
+        self.counter = BufferedCounter(Recipe, 'views_count')
+
+    def get_views(self):
+        return list(
+            Recipe.objects.order_by('pk').values_list(
+                'views_count', flat=True
+            )
+        )
+
+    def test_no_lost_increments_under_concurrent_threads(self):
+        threads, increments = 8, 2000
+        stop = Event()
+
+        def add():
+            for number in range(increments):
+                self.counter.add(self.recipe_ids[number % 2])
+
+        def flush():
+            try:
+                while not stop.is_set():
+                    try:
+                        self.counter.flush()
+                    except DatabaseError:
+                        # Приращения вернулись в очередь.
+                        pass
+            finally:
+                connection.close()
+
+        flusher = Thread(target=flush)
+        flusher.start()
+        workers = [Thread(target=add) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        stop.set()
+        flusher.join()
+        self.counter.flush()
+        half = threads * increments // 2
+        self.assertEqual(self.get_views(), [half, half, 0])
+
+    def test_failed_flush_writes_nothing(self):
+        first, second, _ = self.recipe_ids
+        self.counter.add(first)
+        self.counter.add(second, 2)
+        update = QuerySet.update
+        calls = []
+
+        def fail_second_update(queryset, **kwargs):
+            calls.append(kwargs)
+            if len(calls) == 2:
+                raise DatabaseError('Ошибка записи.')
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', fail_second_update):
+            with self.assertRaises(DatabaseError):
+                self.counter.flush()
+        self.assertEqual(self.get_views(), [0, 0, 0])
+        self.counter.flush()
+        self.assertEqual(self.get_views(), [1, 2, 0])
+
+
+class ImageVariantsTest(TransactionTestCase):
+    """Уменьшенные копии строятся фоновым потоком и отдаются в API."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(MEDIA_ROOT=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def tearDown(self):
+        recipe_views.flush()
+
+    def test_variants(self):
+        buf = io.BytesIO()
+        Image.new('RGB', (2000, 1000), 'red').save(buf, 'PNG')
+        name = default_storage.save(
+            'recipe/images/recipe.png', ContentFile(buf.getvalue())
+        )
+        author = User.objects.create(
+            email='author@example.com', username='author'
+        )
+        # bulk_create не вызывает сигналы рецепта.
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author=author,
+                    name='Рецепт',
+                    text='Описание',
+                    image=name,
+                    cooking_time=10,
+                ),
+            )
+        )
+        recipe = Recipe.objects.get()
+        executor.submit(make_image_variants, recipe.pk, name).result()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_variants['source'], name)
+        for variant, size in django_settings.IMAGE_VARIANTS.items():
+            with self.subTest(variant):
+                with default_storage.open(
+                    recipe.image_variants[variant]
+                ) as file, Image.open(file) as image:
+                    self.assertEqual(image.format, 'WEBP')
+                    self.assertEqual(image.width, size[0])
+                    self.assertLessEqual(image.height, size[1])
+        response = self.client.get(f'/api/recipes/{recipe.pk}/')
+        self.assertEqual(
+            response.data['image_variants'].keys(),
+            django_settings.IMAGE_VARIANTS.keys(),
+        )
@@ -0,0 +1,100 @@
+from django.conf import settings
+from django.db.models import Q
+
+from recipes.models import Recipe, Subscription, TimelineEntry
+
+
+def is_fanout_author(author):
+    """Раскладывать ли рецепты автора по лентам подписчиков."""
+    return author.subscribers_count <= settings.TIMELINE_FANOUT_LIMIT
+
+
+def fan_out(recipe):
+    """Записывает новый рецепт в ленты подписчиков автора пачками."""
+    if not is_fanout_author(recipe.author):
+        return
+    user_ids = Subscription.objects.filter(
+        author=recipe.author_id
+    ).values_list('user_id', flat=True)
+    batch = []
+    for user_id in user_ids.iterator():
+        batch.append(
+            TimelineEntry(
+                user_id=user_id,
+                author_id=recipe.author_id,
+                recipe=recipe,
+                pub_date=recipe.pub_date,
+            )
+        )
+        if len(batch) >= settings.TIMELINE_BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def backfill(user_id, author):
+    """Последние рецепты автора в ленту нового подписчика."""
+    if not is_fanout_author(author):
+        return
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id,
+                author_id=author.pk,
+                recipe_id=recipe_id,
+                pub_date=pub_date,
+            )
+            for recipe_id, pub_date in Recipe.objects.filter(author=author)
+            .order_by('-pub_date', '-id')
+            .values_list('id', 'pub_date')[: settings.TIMELINE_BACKFILL_SIZE]
+        ),
+        ignore_conflicts=True,
+    )
+
+
+def prune(user_id, author_id):
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def after(position, id_field):
+    """Записи после позиции (pub_date, id) в порядке -pub_date, -id."""
+    pub_date, recipe_id = position
+    return Q(pub_date__lt=pub_date) | Q(
+        pub_date=pub_date, **{f'{id_field}__lt': recipe_id}
+    )
+
+
+def get_feed(user, limit, position=None):
+    """Ключи (pub_date, id рецепта) страницы ленты после position.
+    Страница читается из ленты пользователя по индексу, к ней
+    добавляются не более limit рецептов каждого автора, чьи рецепты
+    не раскладываются по лентам."""
+    entries = TimelineEntry.objects.filter(user=user)
+    if position is not None:
+        entries = entries.filter(after(position, 'recipe_id'))
+    keys = set(
+        entries.order_by('-pub_date', '-recipe_id').values_list(
+            'pub_date', 'recipe_id'
+        )[:limit]
+    )
+    authors = list(
+        Subscription.objects.filter(
+            user=user,
+            author__subscribers_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+        )
+        .order_by()
+        .values_list('author_id', flat=True)
+    )
+    # Рецепты каждого автора читаются отдельно по индексу
+    # (author, -pub_date, -id): запрос по нескольким авторам
+    # сортировал бы все их рецепты.
+    for author in authors:
+        recipes = Recipe.objects.filter(author=author)
+        if position is not None:
+            recipes = recipes.filter(after(position, 'id'))
+        keys.update(
+            recipes.order_by('-pub_date', '-id').values_list(
+                'pub_date', 'id'
+            )[:limit]
+        )
+    return sorted(keys, reverse=True)[:limit]
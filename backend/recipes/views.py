@@ -2,6 +2,7 @@ from django.http import HttpResponseRedirect
 from django.shortcuts import get_object_or_404
 from rest_framework.views import APIView
 
+from recipes.counters import short_link_hits
 from recipes.models import Recipe
 from recipes.validators import validate_link
 
@@ -11,7 +12,10 @@ class ShortLinkView(APIView):
 
     def get(self, request, encode_id=None):
         decode_id = int(validate_link(encode_id))
-        recipe = get_object_or_404(Recipe, pk=decode_id)
+        recipe_id = get_object_or_404(
+            Recipe.objects.values_list('id', flat=True), pk=decode_id
+        )
+        short_link_hits.add(recipe_id)
         return HttpResponseRedirect(
-            request.build_absolute_uri(f'/recipes/{recipe.id}/')
+            request.build_absolute_uri(f'/recipes/{recipe_id}/')
         )